@@ -0,0 +1,158 @@
+# ---------- あけおめ統計 ----------
+# akeome_history（{日付: {ユーザーID: 日時}}）を列ごとのNumPy配列に変換し、
+# 連続記録・平均/中央値・順位（パーセンタイル）・年ごとの比較をまとめて計算します。
+# Discord/Firestoreには依存しません。
+from datetime import date, datetime
+
+import numpy as np
+
+# 0時からの秒数は日本時間で数える（履歴の日時はUTCのまま渡される）
+JST_OFFSET_SECONDS = 9 * 3600
+
+
+def build_history_columns(history: dict) -> dict:
+    """あけおめ履歴を列形式（ユーザー番号・日付・年・0時からの秒数）の配列に変換します。"""
+    empty = {
+        "users": np.array([], dtype=str),
+        "user_index": np.array([], dtype=np.int64),
+        "day": np.array([], dtype=np.int64),
+        "year": np.array([], dtype=np.int64),
+        "seconds": np.array([], dtype=np.float64),
+    }
+    return extend_history_columns(empty, history)
+
+
+def extend_history_columns(columns: dict, history: dict) -> dict:
+    """列形式のデータに履歴を追加した新しい列データを返します。（元のデータは変更しません）"""
+    users = columns["users"].tolist()
+    user_lookup = {uid: i for i, uid in enumerate(users)}
+    user_index = []
+    day_ordinals = []
+    seconds = []
+    for date_str, records in history.items():
+        try:
+            day = date.fromisoformat(date_str)
+        except (TypeError, ValueError):
+            continue
+        ordinal = day.toordinal()
+        for uid, ts in records.items():
+            if not isinstance(ts, datetime):
+                continue
+            uid = str(uid)
+            if uid not in user_lookup:
+                user_lookup[uid] = len(users)
+                users.append(uid)
+            user_index.append(user_lookup[uid])
+            day_ordinals.append(ordinal)
+            seconds.append((ts.timestamp() + JST_OFFSET_SECONDS) % 86400)
+
+    days = np.array(day_ordinals, dtype=np.int64)
+    # 日付 -> 年 の変換は日数分だけ行い、各記録へは逆引きで割り当てる
+    unique_days, day_index = np.unique(days, return_inverse=True)
+    unique_years = np.array([date.fromordinal(int(o)).year for o in unique_days], dtype=np.int64)
+    return {
+        "users": np.array(users, dtype=str),
+        "user_index": np.concatenate((columns["user_index"], np.array(user_index, dtype=np.int64))),
+        "day": np.concatenate((columns["day"], days)),
+        "year": np.concatenate((columns["year"], unique_years[day_index])),
+        "seconds": np.concatenate((columns["seconds"], np.array(seconds, dtype=np.float64))),
+    }
+
+
+def compute_user_table(columns: dict, today_ordinal: int) -> dict:
+    """ユーザーごとの記録数・平均・中央値・最長/現在の連続記録を配列で計算します。"""
+    n_users = len(columns["users"])
+    user_index = columns["user_index"]
+    days = columns["day"]
+    seconds = columns["seconds"]
+
+    counts = np.bincount(user_index, minlength=n_users)
+    mean = np.bincount(user_index, weights=seconds, minlength=n_users) / np.maximum(counts, 1)
+
+    # 中央値: (ユーザー, 秒数) で並べ、各ユーザーの区間の中央を取り出す
+    order = np.lexsort((seconds, user_index))
+    sorted_seconds = seconds[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if n_users else np.array([], dtype=np.int64)
+    median = np.zeros(n_users)
+    has_records = counts > 0
+    low = (starts + (counts - 1) // 2)[has_records]
+    high = (starts + counts // 2)[has_records]
+    median[has_records] = (sorted_seconds[low] + sorted_seconds[high]) / 2
+
+    # 連続記録: (ユーザー, 日付) で並べ、ユーザーが変わるか日付が1日以上空いた所で区切る
+    longest_streak = np.zeros(n_users, dtype=np.int64)
+    current_streak = np.zeros(n_users, dtype=np.int64)
+    if days.size:
+        order = np.lexsort((days, user_index))
+        streak_users = user_index[order]
+        streak_days = days[order]
+        breaks = np.ones(len(order), dtype=bool)
+        breaks[1:] = (streak_users[1:] != streak_users[:-1]) | (streak_days[1:] - streak_days[:-1] != 1)
+        run_id = np.cumsum(breaks) - 1
+        run_length = np.bincount(run_id)
+        run_user = streak_users[breaks]
+        run_last_day = streak_days[np.concatenate((np.flatnonzero(breaks)[1:] - 1, [len(order) - 1]))]
+        np.maximum.at(longest_streak, run_user, run_length)
+        # 今日または昨日まで続いている連続記録を「現在の連続記録」とする
+        alive = run_last_day >= today_ordinal - 1
+        np.maximum.at(current_streak, run_user[alive], run_length[alive])
+
+    return {
+        "count": counts,
+        "mean": mean,
+        "median": median,
+        "longest_streak": longest_streak,
+        "current_streak": current_streak,
+    }
+
+
+def build_stats(columns: dict, today_ordinal: int) -> dict:
+    """列データからユーザー別集計を作り、参照用の辞書とまとめて返します。"""
+    table = compute_user_table(columns, today_ordinal)
+    user_lookup = {uid: i for i, uid in enumerate(columns["users"].tolist())}
+    return {"columns": columns, "table": table, "user_lookup": user_lookup}
+
+
+def summarize_user(stats: dict, user_id: str):
+    """指定ユーザーの統計を辞書で返します。記録がなければ None を返します。"""
+    idx = stats["user_lookup"].get(str(user_id))
+    if idx is None:
+        return None
+    columns = stats["columns"]
+    table = stats["table"]
+
+    # パーセンタイル: 自分以外のユーザーのうち、中央値が自分より遅い人の割合（大きいほど速い）
+    medians = table["median"][table["count"] > 0]
+    others = medians.size - 1
+    slower_ratio = float(np.count_nonzero(medians > table["median"][idx])) / others if others > 0 else 1.0
+
+    # 年ごとの平均・中央値・記録数
+    mask = columns["user_index"] == idx
+    user_years = columns["year"][mask]
+    user_seconds = columns["seconds"][mask]
+    yearly = []
+    for year in np.unique(user_years):
+        year_seconds = user_seconds[user_years == year]
+        yearly.append({
+            "year": int(year),
+            "count": int(year_seconds.size),
+            "mean": float(year_seconds.mean()),
+            "median": float(np.median(year_seconds)),
+        })
+
+    return {
+        "count": int(table["count"][idx]),
+        "mean": float(table["mean"][idx]),
+        "median": float(table["median"][idx]),
+        "longest_streak": int(table["longest_streak"][idx]),
+        "current_streak": int(table["current_streak"][idx]),
+        "faster_than_ratio": slower_ratio,
+        "yearly": yearly,
+    }
+
+
+def top_streaks(stats: dict, limit: int = 5) -> list:
+    """現在の連続記録が長い順に (ユーザーID, 日数) を返します。"""
+    current = stats["table"]["current_streak"]
+    order = np.argsort(-current, kind="stable")[:limit]
+    return [(str(stats["columns"]["users"][i]), int(current[i])) for i in order if current[i] > 0]
@@ -0,0 +1,55 @@
+# ---------- あいさつキーワード判定のベンチマーク ----------
+# 使い方: python bench_greeting.py
+# キーワード数を増やしたときの、1メッセージあたりの判定時間を
+# 「キーワードごとに検索する方法」と Aho-Corasick（greeting.py）で比較します。
+import random
+from timeit import timeit
+
+from greeting import MATCH_CONTAINS, MATCH_EXACT, build_greeting_matcher, match_greetings, normalize_greeting_text
+
+HIRAGANA = [chr(code) for code in range(0x3042, 0x3094)]
+
+
+def make_keywords(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    keywords = [("あけおめ", MATCH_EXACT)]
+    while len(keywords) < count:
+        word = "".join(rng.choice(HIRAGANA) for _ in range(rng.randint(3, 8)))
+        keywords.append((word, MATCH_EXACT if rng.random() < 0.5 else MATCH_CONTAINS))
+    return keywords
+
+
+def make_messages(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    messages = ["あけおめ", "ｱｹｵﾒ", "今日もよろしくお願いします！"]
+    while len(messages) < count:
+        messages.append("".join(rng.choice(HIRAGANA) for _ in range(rng.randint(5, 60))))
+    return messages
+
+
+def naive_match(keywords: list, text: str) -> list:
+    normalized = normalize_greeting_text(text)
+    found = []
+    for keyword, mode in keywords:
+        normalized_keyword = normalize_greeting_text(keyword)
+        if (mode == MATCH_EXACT and normalized == normalized_keyword) or (mode == MATCH_CONTAINS and normalized_keyword in normalized):
+            found.append((keyword, mode))
+    return found
+
+
+def main():
+    messages = make_messages(1000)
+    print(f"{'キーワード数':>10} {'構築(ms)':>10} {'Aho-Corasick(µs/件)':>22} {'逐次検索(µs/件)':>18}")
+    for keyword_count in (10, 100, 1000, 5000):
+        keywords = make_keywords(keyword_count)
+        build_ms = timeit(lambda: build_greeting_matcher(keywords), number=1) * 1000
+        matcher = build_greeting_matcher(keywords)
+        for message in messages[:50]:
+            assert sorted(match_greetings(matcher, message)) == sorted(naive_match(keywords, message)), message
+        automaton_us = timeit(lambda: [match_greetings(matcher, m) for m in messages], number=3) / (3 * len(messages)) * 1_000_000
+        naive_us = timeit(lambda: [naive_match(keywords, m) for m in messages[:100]], number=1) / 100 * 1_000_000
+        print(f"{keyword_count:>10} {build_ms:>10.1f} {automaton_us:>22.1f} {naive_us:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# ---------- 起動時の状態読み込みのベンチマーク ----------
+# 使い方: python bench_startup.py
+# 再起動から準備完了までのうち、状態の読み込みにかかる時間を比較します。
+#   変更前: Firestoreから get() でドキュメントを読み込み、to_dict() した後、全履歴の日時を日本時間に変換する
+#   変更後: ローカルスナップショットを読み込んで戻すだけ（日時はUTCのまま持ち、表示時に変換する。
+#           Firestoreとの差分はリスナーの初回通知で反映するため、準備完了までの時間には含まれない）
+# 環境変数 BENCH_FIRESTORE_DOC に「コレクション/ドキュメント」を指定すると、そのドキュメントに試験用の状態を書き込み、
+# 実際の get()（ネットワークを含む）で変更前の時間を計測します。（1MiBを超える状態はFirestoreに保存できないため「-」）
+# 指定しない場合は get() を「to_dict() と同じ独立したコピーを作る処理」で置き換えます。
+# この場合はネットワークとprotobufの変換を含まないため、変更前の時間は実際より短く出ます。
+import copy
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+from timeit import repeat
+
+from local_snapshot import decode_snapshot, read_snapshot, write_snapshot
+
+JST = timezone(timedelta(hours=9))
+BENCH_FIRESTORE_DOC = os.environ.get("BENCH_FIRESTORE_DOC")
+
+
+def make_state(years: int, users_per_day: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    start = datetime(2026 - years, 1, 1, tzinfo=timezone.utc)
+    history = {}
+    for day in range(years * 365):
+        midnight = start + timedelta(days=day)
+        history[(midnight.astimezone(JST)).date().isoformat()] = {
+            str(10**17 + rng.randrange(users_per_day * 3)): midnight + timedelta(seconds=rng.uniform(0, 600))
+            for _ in range(users_per_day)
+        }
+    greeting_history = {"123456789012345678": {"ことよろ": dict(list(history.items())[-365:])}}
+    return {
+        "first_akeome_winners": {date_str: next(iter(recs)) for date_str, recs in history.items()},
+        "akeome_history": history,
+        "last_akeome_channel_id": 1,
+        "start_date": "2025-01-01",
+        "threadline_settings": {str(i): ["message", "poll"] for i in range(50)},
+        "thread_keepalive": {str(10**18 + i): [1, 1_800_000_000, 1_700_000_000] for i in range(2000)},
+        "command_sync_hashes": {"global": "0" * 64},
+        "threadline_backfills": {},
+        "greeting_settings": {"123456789012345678": {"ことよろ": "exact"}},
+        "greeting_winners": {},
+        "greeting_history": greeting_history,
+    }
+
+
+class CopiedDocument:
+    """get() の代わり。to_dict() は呼ぶたびに独立したコピーを返す（ネットワークとprotobufの変換は含まない）"""
+
+    def __init__(self, state: dict):
+        self.state = state
+
+    def to_dict(self) -> dict:
+        return copy.deepcopy(self.state)
+
+
+def firestore_getter(state: dict):
+    """実際のFirestoreに状態を書き込み、get() する関数を返します。書き込めない場合は None を返します。"""
+    from google.cloud import firestore as google_firestore
+
+    doc_ref = google_firestore.Client().document(BENCH_FIRESTORE_DOC)
+    try:
+        doc_ref.set(state)
+    except Exception as e:
+        print(f"  (Firestoreに書き込めませんでした: {type(e).__name__})")
+        return None
+    return doc_ref.get
+
+
+# 変更前の読み込み処理（get() した状態の履歴の日時をすべて日本時間に変換していた）
+def load_before(get_doc):
+    data = get_doc().to_dict()
+    data["akeome_history"] = {
+        date_str: {str(uid): ts.astimezone(JST) if isinstance(ts, datetime) else ts for uid, ts in recs.items()}
+        for date_str, recs in data.get("akeome_history", {}).items()
+    }
+    return data
+
+
+def load_after(path: str):
+    _, _, payload = read_snapshot(path)
+    return decode_snapshot(payload)
+
+
+def main():
+    before_label = "get()実測" if BENCH_FIRESTORE_DOC else "get()代替"
+    print(f"{'年数':>6} {'記録数':>8} {'ファイル(KB)':>12} {'変更前 ' + before_label + '(ms)':>20} {'変更後(ms)':>12}")
+    for years, users_per_day in ((1, 30), (5, 50), (10, 100)):
+        state = make_state(years, users_per_day)
+        records = sum(len(recs) for recs in state["akeome_history"].values())
+        if BENCH_FIRESTORE_DOC:
+            get_doc = firestore_getter(state)
+        else:
+            document = CopiedDocument(state)
+            get_doc = lambda: document  # noqa: E731
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "state_snapshot.bin")
+            write_snapshot(path, state, (0, 0))
+            size_kb = os.path.getsize(path) / 1024
+            assert load_after(path) == state
+            before = f"{min(repeat(lambda: load_before(get_doc), number=1, repeat=5)) * 1000:.1f}" if get_doc else "-"
+            after_ms = min(repeat(lambda: load_after(path), number=1, repeat=5)) * 1000
+        print(f"{years:>6} {records:>8} {size_kb:>12.0f} {before:>20} {after_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
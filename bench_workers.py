@@ -0,0 +1,100 @@
+# ---------- ワーカープロセスのベンチマーク ----------
+# 使い方: python bench_workers.py
+# メッセージ判定（classify_thread_message）とランキング集計（rank_entries）について、
+#   同じプロセス内で実行した場合
+#   ProcessPoolExecutor で1件ずつ送った場合（以前の実装）
+#   worker_pool（要求をまとめて送る）で実行した場合（メッセージ判定のみ）
+# の1件あたりの時間を、ワーカー数を変えて比較します。
+# 同時に届く要求の数（バースト）が多いほど、まとめて送る効果が大きくなります。
+import asyncio
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+
+import worker_pool
+from feature_logic import classify_thread_message, rank_entries
+
+WORKER_COUNTS = (1, 2, 4)
+BURST = 200
+ROUNDS = 20
+
+
+def make_events(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    texts = ["**今日の議題**　詳細はこちら", "https://example.com/news 記事の共有です", "# 見出し\n本文", "質問です　よろしくお願いします"]
+    events = []
+    for _ in range(count):
+        attachments = [("image/png", "a.png")] if rng.random() < 0.2 else []
+        events.append({
+            "content": rng.choice(texts) * rng.randint(1, 5),
+            "has_poll": False,
+            "poll_question": None,
+            "attachments": attachments,
+            "author_display_name": "テストユーザー",
+            "enabled_types": ["message", "media", "link"],
+        })
+    return events
+
+
+def make_records(count: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    midnight = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return {str(10**17 + i): midnight + timedelta(seconds=rng.uniform(0, 600)) for i in range(count)}
+
+
+def per_item_us(elapsed: float, count: int) -> float:
+    return elapsed / count * 1_000_000
+
+
+def bench_inline(func, args_list) -> float:
+    started = perf_counter()
+    for args in args_list:
+        func(*args)
+    return per_item_us(perf_counter() - started, len(args_list))
+
+
+async def bench_process_pool(func, args_list, workers: int) -> float:
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        await asyncio.gather(*(loop.run_in_executor(pool, int) for _ in range(workers)))
+        started = perf_counter()
+        for i in range(0, len(args_list), BURST):
+            await asyncio.gather(*(loop.run_in_executor(pool, func, *args) for args in args_list[i:i + BURST]))
+        return per_item_us(perf_counter() - started, len(args_list))
+
+
+async def bench_worker_pool(func, args_list, workers: int) -> float:
+    await worker_pool.start_workers(workers)
+    try:
+        await asyncio.gather(*(worker_pool.run_task(func, *args_list[0]) for _ in range(workers)))
+        started = perf_counter()
+        for i in range(0, len(args_list), BURST):
+            await asyncio.gather(*(worker_pool.run_task(func, *args) for args in args_list[i:i + BURST]))
+        return per_item_us(perf_counter() - started, len(args_list))
+    finally:
+        await worker_pool.stop_workers()
+
+
+async def main():
+    print(f"CPUコア数: {os.cpu_count()} / バースト: {BURST} 件")
+    cases = [
+        ("メッセージ判定", classify_thread_message, [(event,) for event in make_events(BURST * ROUNDS)]),
+        ("ランキング(300件)", rank_entries, [(make_records(300, seed),) for seed in range(BURST * 2)]),
+    ]
+    for label, func, args_list in cases:
+        print(f"\n{label}")
+        print(f"{'方式':<24} {'ワーカー数':>10} {'µs/件':>10}")
+        print(f"{'同じプロセス':<24} {'-':>10} {bench_inline(func, args_list):>10.1f}")
+        for workers in WORKER_COUNTS:
+            print(f"{'ProcessPoolExecutor':<24} {workers:>10} {await bench_process_pool(func, args_list, workers):>10.1f}")
+        if func.__name__ not in worker_pool.TASKS:
+            continue
+        for workers in WORKER_COUNTS:
+            print(f"{'worker_pool':<24} {workers:>10} {await bench_worker_pool(func, args_list, workers):>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
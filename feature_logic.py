@@ -0,0 +1,138 @@
+# ---------- メッセージ判定・ランキング集計 ----------
+# Discordへの接続やFirestoreに依存しない、純粋な計算処理だけをまとめたモジュールです。
+import re
+
+BOT_COMMAND_PREFIXES = ('!', '/', '$', '%', '.', '?', ';', ',')
+
+
+def normalize_message_event(message, enabled_types) -> dict:
+    """discord.Message から、スレッド判定に必要な情報だけを取り出した辞書を作ります。"""
+    poll_question_text = None
+    if message.poll is not None and hasattr(message.poll, 'question'):
+        if isinstance(message.poll.question, str):
+            poll_question_text = message.poll.question
+        elif hasattr(message.poll.question, 'text') and isinstance(message.poll.question.text, str):
+            poll_question_text = message.poll.question.text
+
+    return {
+        "content": message.content,
+        "has_poll": bool(message.poll),
+        "poll_question": poll_question_text,
+        "attachments": [(att.content_type, att.filename) for att in message.attachments],
+        "author_display_name": message.author.display_name,
+        "enabled_types": list(enabled_types),
+    }
+
+
+# --- テキストからスレッド名を生成するヘルパー関数 ---
+def get_thread_name_from_text(content: str) -> str:
+    """ メッセージ内容からスレッド名を生成します。 """
+    # マークダウン（太字・斜体）を除去
+    cleaned_content = re.sub(r'(\*{1,3}|__)(.*?)\1', r'\2', content)
+    # 見出し記号（行頭の#）を除去
+    cleaned_content = re.sub(r'^\s*#{1,3}\s+', '', cleaned_content)
+    # ★ 修正: 最初の「全角スペース」までを取得（半角スペースは許可）
+    title_candidate = re.split(r'　', cleaned_content, 1)[0]
+    # 80文字に制限し、前後の空白を除去
+    temp_name = title_candidate[:80].strip()
+    # ファイル名に使えない文字を除去
+    temp_name = re.sub(r'[\\/*?"<>|:]', '', temp_name)
+    # 結果が空ならデフォルト名を返す
+    return temp_name if temp_name else "関連スレッド"
+
+
+def classify_thread_message(event: dict):
+    """
+    正規化済みのメッセージ情報から、作成するスレッドの種類・名前・リアクションを決定します。
+    スレッドを作成しない場合は (None, "", None) を返します。
+    """
+    enabled_types = event["enabled_types"]
+    content = event["content"]
+    attachments = event["attachments"]
+    author_display_name = event["author_display_name"]
+
+    message_type = None
+    thread_name = ""
+    reaction_emoji = None
+
+    # --- 各要素の存在確認 ---
+    is_poll = "poll" in enabled_types and event["has_poll"]
+    is_media = "media" in enabled_types and attachments and any(content_type and content_type.startswith(('image/', 'video/')) for content_type, _ in attachments)
+    # media と file が重複しないように
+    is_file = "file" in enabled_types and attachments and not is_media
+    is_link = "link" in enabled_types and re.search(r'httpsS?://\S+', content)
+
+    cleaned_content_for_check = content.strip()
+
+    # ★ 変更: テキストが「存在するか」の判定 (設定に依存しない)
+    has_valid_text = (
+        cleaned_content_for_check and  # 空白のみを除外
+        not event["has_poll"] and
+        not cleaned_content_for_check.startswith(BOT_COMMAND_PREFIXES) and
+        not (cleaned_content_for_check.startswith('#') and not cleaned_content_for_check.startswith('# '))
+    )
+
+    # ★ 変更: 「テキスト単体」でのスレッド作成（message=True の場合）の判定
+    is_text_message_only = (
+        "message" in enabled_types and
+        has_valid_text and
+        not is_poll and
+        not is_media and
+        not is_file and
+        not is_link # 他のタイプが含まれていないことを確認
+    )
+
+    # --- 優先度（リアクションとデフォルト名）の決定 ---
+    if is_poll:
+        message_type = "poll"
+        poll_question_text = event["poll_question"] or "投票"
+
+        temp_name = poll_question_text[:100].strip()
+        # ★ 修正: 最初の「全角スペース」で分割
+        fullwidth_space_match = re.search(r'　', temp_name)
+        if fullwidth_space_match:
+            temp_name = temp_name[:fullwidth_space_match.start()].strip()
+        thread_name = temp_name if temp_name else "投票に関するスレッド"
+        reaction_emoji = "✅"
+
+    elif is_media:
+        message_type = "media"
+        thread_name = f"{author_display_name}さんのメディア投稿"
+        reaction_emoji = "🖼️"
+
+    elif is_file:
+        message_type = "file"
+        thread_name = attachments[0][1] or f"{author_display_name}さんの添付ファイル"
+        thread_name = thread_name[:100].strip()
+        reaction_emoji = "📎"
+
+    elif is_link:
+        message_type = "link"
+        thread_name = content.split('\n')[0][:80].strip() or "リンクに関する話題"
+        reaction_emoji = "🔗"
+
+    elif is_text_message_only: # ★ 変更: is_text_message -> is_text_message_only
+        message_type = "message"
+        thread_name = get_thread_name_from_text(content)
+        reaction_emoji = "💬"
+
+    # --- スレッド名のオーバーライド（要求された機能） ---
+    # テキストがあり、かつ優先タイプが「メディア」「ファイル」「リンク」の場合、
+    # スレッド名をテキストベースのものに上書きする
+    if has_valid_text and message_type in ["media", "file", "link"]: # ★ 変更: is_text_message -> has_valid_text
+        thread_name = get_thread_name_from_text(content)
+
+    return message_type, thread_name, reaction_emoji
+
+
+def rank_entries(entries: dict, reverse: bool = False) -> list:
+    """{ユーザーID: 値} を値の順に並べた (ユーザーID, 値) のリストを返します。"""
+    return sorted(entries.items(), key=lambda item: item[1], reverse=reverse)
+
+
+def count_winners(winners: dict) -> list:
+    """{日付: ユーザーID} から一番乗り回数を数え、回数の多い順に並べて返します。"""
+    winner_counts = {}
+    for uid_winner in winners.values():
+        winner_counts[uid_winner] = winner_counts.get(uid_winner, 0) + 1
+    return rank_entries(winner_counts, reverse=True)
@@ -0,0 +1,88 @@
+# ---------- あいさつキーワード判定 ----------
+# サーバーごとに設定された複数のキーワード（「あけおめ」「ことよろ」「メリクリ」など）を
+# 1つの Aho-Corasick オートマトンにまとめ、メッセージを1回走査するだけで判定します。
+# 全角/半角・カタカナ/ひらがな・大文字/小文字の違いは正規化して吸収します。
+# Discord/Firestoreには依存しません。
+import unicodedata
+from collections import deque
+
+MATCH_EXACT = "exact"        # メッセージ全体がキーワードと一致した場合のみ
+MATCH_CONTAINS = "contains"  # メッセージのどこかにキーワードが含まれていれば
+
+# カタカナ（ァ～ヶ）をひらがな（ぁ～ゖ）に変換する表
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def normalize_greeting_text(text: str) -> str:
+    """全角/半角（NFKC）・カタカナ/ひらがな・大文字/小文字の違いをなくし、前後の空白を除去します。"""
+    return unicodedata.normalize("NFKC", text).casefold().translate(_KATAKANA_TO_HIRAGANA).strip()
+
+
+def build_greeting_matcher(keywords: list) -> dict:
+    """
+    [(キーワード, 判定方法), ...] から Aho-Corasick オートマトンを作ります。
+    正規化後に同じになるキーワードは、先に指定されたものだけを使います。
+    """
+    goto = [{}]
+    fail = [0]
+    output = [[]]
+    entries = []
+    seen = set()
+    for keyword, mode in keywords:
+        normalized = normalize_greeting_text(keyword)
+        if not normalized or normalized in seen:
+            continue
+        seen.add(normalized)
+        node = 0
+        for ch in normalized:
+            next_node = goto[node].get(ch)
+            if next_node is None:
+                next_node = len(goto)
+                goto[node][ch] = next_node
+                goto.append({})
+                fail.append(0)
+                output.append([])
+            node = next_node
+        output[node].append(len(entries))
+        entries.append((keyword, mode, len(normalized)))
+
+    # 失敗リンクを幅優先で設定し、出力を失敗先のものと合わせておく
+    queue = deque(goto[0].values())
+    while queue:
+        node = queue.popleft()
+        for ch, child in goto[node].items():
+            queue.append(child)
+            fallback = fail[node]
+            while fallback and ch not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[child] = goto[fallback].get(ch, 0)
+            output[child] = output[child] + output[fail[child]]
+
+    return {"goto": goto, "fail": fail, "output": output, "entries": entries}
+
+
+def match_greetings(matcher: dict, text: str) -> list:
+    """メッセージに一致したキーワードを (キーワード, 判定方法) として、見つかった順に（重複なく）返します。"""
+    normalized = normalize_greeting_text(text)
+    text_length = len(normalized)
+    goto = matcher["goto"]
+    fail = matcher["fail"]
+    output = matcher["output"]
+    entries = matcher["entries"]
+
+    node = 0
+    found = []
+    found_ids = set()
+    for position, ch in enumerate(normalized, 1):
+        while node and ch not in goto[node]:
+            node = fail[node]
+        node = goto[node].get(ch, 0)
+        for entry_id in output[node]:
+            keyword, mode, keyword_length = entries[entry_id]
+            # 完全一致は「末尾で終わり、かつ長さが全体と同じ」場合のみ
+            if mode == MATCH_EXACT and (position != text_length or keyword_length != text_length):
+                continue
+            if entry_id not in found_ids:
+                found_ids.add(entry_id)
+                found.append((keyword, mode))
+    return found
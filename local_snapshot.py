@@ -0,0 +1,119 @@
+# ---------- ローカルスナップショット ----------
+# 再起動時にFirestoreの読み込みを待たずに動き始めるため、最後に反映した状態ドキュメントを
+# ローカルファイルに保存します。ヘッダーにドキュメントの更新時刻を入れておき、
+# 起動後に受け取ったFirestoreの状態が同じバージョンかどうかを判定できるようにします。
+# 形式: ヘッダー(マジック, 形式バージョン, 保存時刻, 更新時刻の秒, 更新時刻のナノ秒, 本体長) + JSON(UTF-8)の状態
+# 本体はデータだけの形式で、読み込んでもコードは実行されません。日時は {"$ts": UNIX時刻(マイクロ秒)} で保存し、
+# 読み込み時にUTCの datetime に戻します。（Firestore固有の型には依存しません）
+# Discord/Firestoreには依存しません。
+import json
+import os
+import struct
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+SNAPSHOT_MAGIC = b"AKSN"
+SNAPSHOT_VERSION = 3
+SNAPSHOT_HEADER = struct.Struct("<4sHdqiI")
+TIMESTAMP_TAG = "$ts"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# 書き込みは1つずつ行い、待っている間に新しい状態が来たら古いものは書き込まない。
+# 更新時刻が既に書き込んだものより古い状態も書き込まない（スレッドの実行順が入れ替わった場合）
+_write_lock = threading.Lock()
+_pending_lock = threading.Lock()
+_pending_writes = {}
+_written_keys = {}
+
+
+def _encode_value(value):
+    """JSONにできない値（日時）をタグ付きの値にします。"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return {TIMESTAMP_TAG: (value - EPOCH) // timedelta(microseconds=1)}
+    raise TypeError(f"スナップショットに保存できない型です: {type(value).__name__}")
+
+
+def _decode_object(obj: dict):
+    """タグ付きの値を日時に戻します。"""
+    if len(obj) == 1 and TIMESTAMP_TAG in obj:
+        return datetime.fromtimestamp(obj[TIMESTAMP_TAG] / 1_000_000, timezone.utc)
+    return obj
+
+
+def encode_snapshot(data: dict) -> bytes:
+    """状態を本体（JSON）にします。"""
+    return json.dumps(data, default=_encode_value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_snapshot(path: str, data: dict, update_key: tuple):
+    """状態をファイルに書き込みます。（同じディレクトリの一時ファイルに書いてから置き換える）"""
+    payload = encode_snapshot(data)
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, datetime.now(timezone.utc).timestamp(), update_key[0], update_key[1], len(payload)
+    )
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def request_snapshot_write(path: str, data: dict, update_key: tuple) -> bool:
+    """
+    書き込みを予約して、順番が来たら書き込みます。（どのスレッドから呼んでもよい）
+    待っている間により新しい状態（更新時刻が後のもの）が予約された場合は、そちらだけを書き込みます。
+    このスレッドで書き込んだ場合は True、書き込まなかった場合は False を返します。
+    """
+    with _pending_lock:
+        pending = _pending_writes.get(path)
+        if pending is None or pending[1] < update_key:
+            _pending_writes[path] = (data, update_key)
+    with _write_lock:
+        with _pending_lock:
+            pending = _pending_writes.pop(path, None)
+        if pending is None or (path in _written_keys and pending[1] <= _written_keys[path]):
+            return False
+        write_snapshot(path, *pending)
+        _written_keys[path] = pending[1]
+        return True
+
+
+def read_snapshot(path: str):
+    """
+    ファイルを読み込み、(更新時刻(秒, ナノ秒), 保存時刻(UNIX秒), 本体) を返します。
+    本体は decode_snapshot() で状態に戻します。ファイルが無い場合は None を返し、
+    形式が異なる場合は ValueError を送出します。
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        header = f.read(SNAPSHOT_HEADER.size)
+        if len(header) < SNAPSHOT_HEADER.size:
+            raise ValueError("ヘッダーが不完全です")
+        magic, version, saved_at, update_seconds, update_nanos, length = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"形式が異なります (バージョン: {version})")
+        payload = f.read(length)
+        if len(payload) < length:
+            raise ValueError("本体が不完全です")
+    return (update_seconds, update_nanos), saved_at, payload
+
+
+def decode_snapshot(payload: bytes) -> dict:
+    """read_snapshot() で読み込んだ本体を状態に戻します。呼ぶたびに独立したコピーを返します。"""
+    return json.loads(payload, object_hook=_decode_object)
@@ -31,12 +31,31 @@ from dotenv import load_dotenv
 from datetime import datetime, time, timezone, timedelta
 import asyncio
 import json
+import hashlib
+import copy
+import socket
+from time import perf_counter
+import heapq
+from collections import OrderedDict
 # 'import re' は上部（localeの近く）に移動しました
 
 # ---------- 変更: google-cloud-firestore を使用 ----------
 from google.cloud import firestore as google_firestore
 
+# ---------- 追加: Discord/Firestoreに依存しない計算処理 ----------
+from feature_logic import normalize_message_event, classify_thread_message, rank_entries, count_winners
+# ---------- 追加: あけおめ統計（NumPy） ----------
+from analytics import build_history_columns, extend_history_columns, build_stats, summarize_user, top_streaks
+# ---------- 追加: あいさつキーワード判定 ----------
+from greeting import MATCH_EXACT, MATCH_CONTAINS, normalize_greeting_text, build_greeting_matcher, match_greetings
+# ---------- 追加: ローカルスナップショット ----------
+from local_snapshot import read_snapshot, decode_snapshot, request_snapshot_write
+# ---------- 追加: ワーカープロセス（任意） ----------
+from worker_pool import start_workers, run_task
+
 # ---------- 初期設定 ----------
+# 起動から準備完了までの時間を計測するための基準
+PROCESS_START = perf_counter()
 load_dotenv()
 TOKEN = os.environ.get('DISCORD_TOKEN')
 # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
@@ -44,6 +63,8 @@ TOKEN = os.environ.get('DISCORD_TOKEN')
 # ★ .envファイルに BOT_AUTHOR=123456789012345678 のように設定してください
 # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
 BOT_AUTHOR_ID = os.environ.get('BOT_AUTHOR')
+# ★ 追加: 開発用サーバーID（設定するとそのサーバーにもコマンドを即時同期します）
+DEV_GUILD_ID = os.environ.get('DEV_GUILD_ID')
 
 
 # ---------- 変更: google-cloud-firestore を使用して初期化 ----------
@@ -63,6 +84,31 @@ except Exception as e:
 # このドキュメントに全てのボットデータを保存します
 bot_data_ref = db.collection("akeomeBotData").document("state")
 
+# ★ 追加: 複数インスタンス間の同期用
+# 保存は変更のあったフィールドだけを update() で書き込み、他のインスタンスの変更を上書きしない
+state_listener = None
+state_save_lock = asyncio.Lock()
+# 最後に受け取ったスナップショットの内容（フィールド単位の差分検出に使う）
+last_state_snapshot = {}
+# 最後に反映した状態ドキュメントの更新時刻 (秒, ナノ秒)。同じバージョンの再反映を省く
+last_applied_update_key = None
+# ローカルスナップショットから起動した場合の本体。Firestoreのバージョンが違ったときだけ、差分検出の基準として読み直す
+local_snapshot_payload = None
+# 起動時に状態を読み込めたか（読み込みに失敗した空の状態を前提にした保存をしないため）
+state_load_ok = False
+# Firestoreの状態を確認する（読み込みに成功するか、リスナーの初回通知を反映する）までは保存を保留する。
+# 古いローカルスナップショットや読み込みに失敗した空の状態で、Firestore上の新しいデータを上書きしないため
+state_writes_enabled = False
+pending_state_updates = []
+
+# ★ 追加: ローカルスナップショット（再起動時の高速読み込み用）
+LOCAL_SNAPSHOT_PATH = os.environ.get('LOCAL_SNAPSHOT_PATH', 'state_snapshot.bin')
+
+# ★ 追加: メッセージ判定を子プロセスで行う場合のワーカー数（0: 使わない）
+# 1コアの環境では同じプロセスで実行するほうが速いため、既定では使わない（bench_workers.py を参照）
+# ワーカーは標準入力が閉じられると終了するため、Botのプロセスが終了すれば一緒に終了する
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', '0'))
+
 
 intents = discord.Intents.all()
 client = discord.Client(intents=intents)
@@ -82,9 +128,61 @@ last_akeome_channel_id = None
 # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
 # ★ 変更: スレッド作成設定を管理するグローバル変数を追加
 # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
-threadline_settings = {} 
+threadline_settings = {}
+# ★ 追加: 過去メッセージへのスレッド作成（バックフィル）の進捗
+# チャンネルID(str) -> {"before": 次に読み込むメッセージの基準ID, "types": [...], "scanned": 件数, "created": 件数, "user_id": 実行者ID,
+#                       "owner": 処理しているインスタンスのID, "heartbeat": 最後に進捗を保存した時刻(UNIX秒)}
+threadline_backfills = {}
+backfill_tasks = {}
+BACKFILL_CONCURRENCY = 3          # 同時に作成するスレッドの最大数
+BACKFILL_CREATE_INTERVAL = 1.5    # スレッド作成を開始する最小間隔（秒）
+BACKFILL_CHECKPOINT_EVERY = 50    # 何件読み込むごとに進捗を保存・報告するか
+BACKFILL_OWNER_TIMEOUT = 600      # 進捗の保存がこの秒数ないインスタンスの処理は、止まったものとして引き継ぐ
+BACKFILL_CLAIM_WAIT = 5           # 処理を引き受けた後、他のインスタンスと重なっていないか確認するまでの待ち時間（秒）
+# このインスタンスの識別子。複数のインスタンスが同じバックフィルを処理しないようにするために使う
+# 再起動しても自分の処理をすぐに再開できるよう、既定ではホスト名を使う（同じホストで複数動かす場合は環境変数で分ける）
+INSTANCE_ID = os.environ.get('INSTANCE_ID') or socket.gethostname()
+backfill_resume_handle = None
+# ★ 追加: サーバーごとのあいさつキーワード（「あけおめ」以外）
+# サーバーID(str) -> {キーワード: 判定方法("exact"/"contains")}
+greeting_settings = {}
+# サーバーID(str) -> {キーワード: {日付: ユーザーID}}
+greeting_winners = {}
+# サーバーID(str) -> {キーワード: {日付: {ユーザーID: 日時}}}
+greeting_history = {}
+# サーバーID(str) -> 組み立て済みの判定器（設定変更時に作り直す）
+greeting_matchers = {}
+GREETING_MAX_KEYWORDS = 50
+# ★ 追加: /akeome_stats 用のキャッシュ（過去分の列データは1日1回だけ作り直す）
+akeome_stats_cache = {}
+# ★ 追加: 最後に同期したスラッシュコマンド定義のハッシュ（"global" またはサーバーID -> ハッシュ）
+command_sync_hashes = {}
 
-BOT_COMMAND_PREFIXES = ('!', '/', '$', '%', '.', '?', ';', ',')
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+# ★ 追加: スレッド延命（キープアライブ）管理
+# ★ Botが作成したスレッドを「アーカイブ予定時刻」順に管理し、
+# ★ アーカイブされる前にまとめて延命します。
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+# スレッドID(str) -> [ギルドID, アーカイブ予定時刻(UNIX秒), 最終発言時刻(UNIX秒)]
+thread_keepalive_index = {}
+# (アーカイブ予定時刻, スレッドID) のヒープ。古いエントリは取り出し時に読み飛ばす
+thread_keepalive_heap = []
+# 前回の保存から変更のあったスレッドID（次回のチェック時にまとめて保存する）
+thread_keepalive_dirty_ids = set()
+
+THREAD_KEEPALIVE_INTERVAL = 600        # 延命チェックの間隔（秒）
+THREAD_KEEPALIVE_MARGIN = 12 * 3600    # アーカイブ予定時刻の何秒前から延命対象にするか
+THREAD_KEEPALIVE_BATCH_SIZE = int(os.environ.get('THREAD_KEEPALIVE_BATCH_SIZE', '10'))  # 1回のチェックで延命する最大数
+THREAD_KEEPALIVE_EDIT_DELAY = 1.5      # 延命リクエスト同士の間隔（秒）
+# 最後の発言からこの日数が経過したスレッドは延命せず管理対象から外す
+THREAD_KEEPALIVE_MAX_IDLE_DAYS = int(os.environ.get('THREAD_KEEPALIVE_MAX_IDLE_DAYS', '30'))
+
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+# ★ 追加: 最近自動スレッド化したメッセージの記録（上限付きLRU）
+# ★ メッセージID -> (スレッドID, メッセージ種別)
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+recent_auto_threads = OrderedDict()
+RECENT_AUTO_THREADS_MAX = 2048
 
 
 # ---------- Helper Function for Permission Check (Stricter) ----------
@@ -149,58 +247,164 @@ async def check_bot_permission(guild: discord.Guild, channel: discord.abc.GuildC
     return False
 
 # ---------- データ永続化 (Firestore) ----------
-async def save_data_async():
-    """現在のボットの状態をFirestoreに非同期で保存します。"""
-    print("Firestoreへのデータ保存を開始します...")
+def state_path(*parts) -> str:
+    """update() に渡すフィールドパスを作ります。（日付やIDなど、記号・数字を含むキーも安全に扱う）"""
+    return google_firestore.FieldPath(*(str(part) for part in parts)).to_api_repr()
+
+async def save_data_async(updates: dict):
+    """
+    変更のあったフィールドだけをFirestoreに非同期で保存します。
+    updates のキーは state_path() で作ったフィールドパス、削除する場合の値は google_firestore.DELETE_FIELD です。
+    Firestoreの状態を確認するまでは保存せず、確認後に保存した順番どおりに書き込みます。
+    """
+    if not updates:
+        return
+    if not state_writes_enabled or pending_state_updates:
+        pending_state_updates.append(updates)
+        if not state_writes_enabled:
+            print(f"Firestoreの状態を確認するまで保存を保留します。(保留中: {len(pending_state_updates)} 件)")
+        return
+    await write_state_updates(updates)
+
+async def write_state_updates(updates: dict):
+    print(f"Firestoreへのデータ保存を開始します... ({len(updates)} 項目)")
     try:
-        data = {
-            "first_akeome_winners": first_akeome_winners,
-            "akeome_history": akeome_history,
-            "last_akeome_channel_id": last_akeome_channel_id,
-            "start_date": start_date.isoformat() if start_date else None,
-            # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
-            # ★ 変更: スレッド設定を保存対象に追加
-            # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
-            "threadline_settings": threadline_settings,
-        }
-        await client.loop.run_in_executor(None, bot_data_ref.set, data)
+        # 保存の順序が入れ替わらないよう、1件ずつ順番に書き込む
+        async with state_save_lock:
+            await client.loop.run_in_executor(None, bot_data_ref.update, updates)
         print("Firestoreへのデータ保存が完了しました。")
     except Exception as e:
         print(f"Firestoreへのデータ保存中にエラーが発生しました: {e}")
 
+def enable_state_writes():
+    """Firestoreの状態を確認できたので保存を始め、保留していた変更を書き込みます。"""
+    global state_writes_enabled
+    if state_writes_enabled:
+        return
+    state_writes_enabled = True
+    print("[状態同期] Firestoreの状態を確認したため、保存を開始します。")
+    if pending_state_updates:
+        client.loop.create_task(flush_pending_state_updates())
+
+async def flush_pending_state_updates():
+    # 書き込み中に追加された保存も、pending_state_updates が空になるまで後ろに並ぶ
+    while pending_state_updates:
+        await write_state_updates(pending_state_updates[0])
+        pending_state_updates.pop(0)
+
+def build_state_data() -> dict:
+    """現在のボットの状態全体を、Firestoreのドキュメント形式の辞書にします。（新規作成用）"""
+    return {
+        "first_akeome_winners": first_akeome_winners,
+        "akeome_history": akeome_history,
+        "last_akeome_channel_id": last_akeome_channel_id,
+        "start_date": start_date.isoformat() if start_date else None,
+        # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+        # ★ 変更: スレッド設定を保存対象に追加
+        # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+        "threadline_settings": threadline_settings,
+        "thread_keepalive": thread_keepalive_index,
+        "command_sync_hashes": command_sync_hashes,
+        "threadline_backfills": threadline_backfills,
+        "greeting_settings": greeting_settings,
+        "greeting_winners": greeting_winners,
+        "greeting_history": greeting_history,
+    }
+
+async def create_state_document_async():
+    """状態ドキュメントが無い場合に、現在の状態で作成します。（既にあれば失敗し、上書きはしない）"""
+    try:
+        await client.loop.run_in_executor(None, bot_data_ref.create, build_state_data())
+        print("Firestoreに状態ドキュメントを新規作成しました。")
+        enable_state_writes()
+    except Exception as e:
+        print(f"Firestoreの状態ドキュメントの作成中にエラーが発生しました: {e}")
+
+def get_update_key(update_time) -> tuple:
+    """ドキュメントの update_time を (秒, ナノ秒) にします。（バージョンの比較とローカルスナップショットのヘッダー用）"""
+    if update_time is None:
+        return (0, 0)
+    timestamp = update_time.timestamp_pb()
+    return (timestamp.seconds, timestamp.nanos)
+
+def save_local_snapshot(data: dict, update_key: tuple):
+    """反映したFirestoreの状態をローカルスナップショットに書き込みます。（別スレッドで実行）"""
+    try:
+        request_snapshot_write(LOCAL_SNAPSHOT_PATH, data, update_key)
+    except Exception as e:
+        print(f"ローカルスナップショットの保存中にエラーが発生しました: {e}")
+
+def apply_loaded_state(data: dict, base: dict, update_key: tuple):
+    """
+    読み込んだ状態（Firestoreまたはローカルスナップショット）をメモリ上に展開します。
+    base は data と同じ内容の別のコピーで、以降のスナップショットとの差分検出の基準にします。
+    （None の場合は、最初に差分を取るときにローカルスナップショットの本体から作ります）
+    日時はUTCのまま持ち、表示するときに日本時間にします。
+    """
+    global first_akeome_winners, akeome_history, last_akeome_channel_id, start_date, threadline_settings, thread_keepalive_index
+    global command_sync_hashes, threadline_backfills, greeting_settings, greeting_winners, greeting_history, last_state_snapshot
+    global last_applied_update_key, state_load_ok
+    last_state_snapshot = base
+    state_load_ok = True
+    last_applied_update_key = update_key
+    first_akeome_winners = data.get("first_akeome_winners", {})
+    akeome_history = data.get("akeome_history", {})
+
+    last_akeome_channel_id = data.get("last_akeome_channel_id")
+    start_date_str = data.get("start_date")
+    if start_date_str:
+        start_date = datetime.fromisoformat(start_date_str).date()
+    else:
+        start_date = None
+
+    # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+    # ★ 変更: スレッド設定を読み込み対象に追加
+    # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+    threadline_settings = data.get("threadline_settings", {})
+    thread_keepalive_index = data.get("thread_keepalive", {})
+    command_sync_hashes = data.get("command_sync_hashes", {})
+    threadline_backfills = data.get("threadline_backfills", {})
+    greeting_settings = data.get("greeting_settings", {})
+    greeting_winners = data.get("greeting_winners", {})
+    greeting_history = data.get("greeting_history", {})
+    greeting_matchers.clear()
+    rebuild_thread_keepalive_heap()
+
+def load_local_snapshot() -> bool:
+    """
+    ローカルスナップショットがあれば読み込み、True を返します。
+    保存はリスナーの初回通知でFirestoreのバージョンを確認するまで保留されたままです。
+    """
+    global local_snapshot_payload
+    try:
+        snapshot = read_snapshot(LOCAL_SNAPSHOT_PATH)
+        if snapshot is None:
+            return False
+        update_key, saved_at, payload = snapshot
+        data = decode_snapshot(payload)
+    except Exception as e:
+        print(f"ローカルスナップショットの読み込み中にエラーが発生しました: {e}")
+        return False
+    apply_loaded_state(data, None, update_key)
+    local_snapshot_payload = payload
+    saved_at_str = datetime.fromtimestamp(saved_at, timezone(timedelta(hours=9))).strftime('%Y-%m-%d %H:%M:%S')
+    print(f"ローカルスナップショットを読み込みました。(保存日時: {saved_at_str})")
+    return True
+
 async def load_data_async():
     """Firestoreからボットの状態を非同期で読み込みます。"""
-    global first_akeome_winners, akeome_history, last_akeome_channel_id, start_date, threadline_settings
+    global first_akeome_winners, akeome_history, last_akeome_channel_id, start_date, threadline_settings, thread_keepalive_index, state_load_ok
     print("Firestoreからのデータ読み込みを開始します...")
     try:
         doc = await client.loop.run_in_executor(None, bot_data_ref.get)
 
         if doc.exists:
-            data = doc.to_dict()
-            first_akeome_winners = data.get("first_akeome_winners", {})
-            
-            raw_history = data.get("akeome_history", {})
-            akeome_history = {
-                date_str: {
-                    str(uid): ts.astimezone(timezone(timedelta(hours=9))) if isinstance(ts, datetime) else ts
-                    for uid, ts in recs.items()
-                }
-                for date_str, recs in raw_history.items()
-            }
-
-            last_akeome_channel_id = data.get("last_akeome_channel_id")
-            start_date_str = data.get("start_date")
-            if start_date_str:
-                start_date = datetime.fromisoformat(start_date_str).date()
-            else:
-                start_date = None
-            
-            # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
-            # ★ 変更: スレッド設定を読み込み対象に追加
-            # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
-            threadline_settings = data.get("threadline_settings", {})
-
+            # to_dict() は呼ぶたびに別のコピーを返す
+            update_key = get_update_key(doc.update_time)
+            apply_loaded_state(doc.to_dict(), doc.to_dict(), update_key)
             print("Firestoreからのデータ読み込みが完了しました。")
+            enable_state_writes()
+            client.loop.run_in_executor(None, save_local_snapshot, last_state_snapshot, update_key)
         else:
             print("Firestoreにデータが見つかりません。新規に作成します。")
             first_akeome_winners = {}
@@ -208,57 +412,412 @@ async def load_data_async():
             last_akeome_channel_id = None
             start_date = None
             threadline_settings = {}
-            await save_data_async()
+            thread_keepalive_index = {}
+            state_load_ok = True
+            # ドキュメントが無いと update() できないため、ここでだけ全体を書き込んで作成する
+            await create_state_document_async()
     except Exception as e:
+        # 保存は保留したまま、リスナーの初回通知か次回の読み込みで状態を受け取れたら始める
         print(f"Firestoreからのデータ読み込み中にエラーが発生しました: {e}")
-        first_akeome_winners = {}
-        akeome_history = {}
-        last_akeome_channel_id = None
-        start_date = None
-        threadline_settings = {}
+        # ローカルスナップショットなどで既に状態を展開している場合は、空の状態で上書きしない
+        if not state_load_ok:
+            first_akeome_winners = {}
+            akeome_history = {}
+            last_akeome_channel_id = None
+            start_date = None
+            threadline_settings = {}
+            thread_keepalive_index = {}
+    rebuild_thread_keepalive_heap()
+
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+# ★ 追加: Firestoreのスナップショットリスナー
+# ★ 他のインスタンスやFirestore上での直接編集による変更を、
+# ★ 再読み込みせずに変更のあったフィールドだけメモリ上の状態へ反映します。
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+SYNCED_STATE_FIELDS = (
+    "threadline_settings", "first_akeome_winners", "akeome_history", "last_akeome_channel_id", "start_date", "thread_keepalive", "command_sync_hashes",
+    "greeting_settings", "greeting_winners", "greeting_history", "threadline_backfills",
+)
+
+def apply_map_changes(target: dict, new: dict, old: dict, convert=copy.deepcopy) -> bool:
+    """
+    前回のスナップショット(old)から今回(new)で変わった値だけを target に反映します。
+    値が両方とも辞書の場合は中までたどり、変わった末端の値だけを書き換えます。
+    どちらのスナップショットにも無いキー（まだ保存中の自分の変更）は、入れ子の中でもそのまま残します。
+    変更があれば True を返します。
+    """
+    changed = False
+    for key in old.keys() - new.keys():
+        target.pop(key, None)
+        changed = True
+    for key, value in new.items():
+        if key in old and old[key] == value:
+            continue
+        if isinstance(value, dict) and isinstance(old.get(key), dict) and isinstance(target.get(key), dict):
+            changed = apply_map_changes(target[key], value, old[key], convert) or changed
+        else:
+            target[key] = convert(value)
+            changed = True
+    return changed
+
+def apply_remote_state(data: dict, update_key: tuple):
+    """スナップショットの内容のうち、前回から変わったキーだけをメモリ上の状態へ反映します。（イベントループ上で実行）"""
+    global last_akeome_channel_id, start_date, first_new_year_message_sent_today, last_state_snapshot, last_applied_update_key
+    global local_snapshot_payload, state_load_ok
+    # Firestoreの状態を確認できたので保存を始める（保留分の書き込みはこの関数の後に実行される）
+    enable_state_writes()
+    state_load_ok = True
+    # 読み込み済みの状態と同じバージョンなら反映するものはない（以降の差分検出の基準だけ受け取る）
+    if update_key == last_applied_update_key:
+        last_state_snapshot = data
+        local_snapshot_payload = None
+        return
+    last_applied_update_key = update_key
+    previous = last_state_snapshot
+    if previous is None:
+        previous = decode_snapshot(local_snapshot_payload) if local_snapshot_payload is not None else {}
+        local_snapshot_payload = None
+    last_state_snapshot = data
+    client.loop.run_in_executor(None, save_local_snapshot, data, update_key)
+
+    changed_fields = [key for key in SYNCED_STATE_FIELDS if data.get(key) != previous.get(key)]
+    if not changed_fields:
+        return
+
+    def field_changes(key: str):
+        return data.get(key) or {}, previous.get(key) or {}
+
+    if "threadline_settings" in changed_fields:
+        apply_map_changes(threadline_settings, *field_changes("threadline_settings"))
+    if "first_akeome_winners" in changed_fields:
+        apply_map_changes(first_akeome_winners, *field_changes("first_akeome_winners"))
+    if "akeome_history" in changed_fields:
+        apply_map_changes(akeome_history, *field_changes("akeome_history"))
+        akeome_stats_cache.clear()
+    if "last_akeome_channel_id" in changed_fields:
+        last_akeome_channel_id = data.get("last_akeome_channel_id")
+    if "start_date" in changed_fields:
+        start_date_str = data.get("start_date")
+        start_date = datetime.fromisoformat(start_date_str).date() if start_date_str else None
+    if "thread_keepalive" in changed_fields:
+        apply_map_changes(thread_keepalive_index, *field_changes("thread_keepalive"))
+        rebuild_thread_keepalive_heap()
+    if "command_sync_hashes" in changed_fields:
+        apply_map_changes(command_sync_hashes, *field_changes("command_sync_hashes"))
+    if "greeting_settings" in changed_fields:
+        apply_map_changes(greeting_settings, *field_changes("greeting_settings"))
+        greeting_matchers.clear()
+    if "greeting_winners" in changed_fields:
+        apply_map_changes(greeting_winners, *field_changes("greeting_winners"))
+    if "greeting_history" in changed_fields:
+        apply_map_changes(greeting_history, *field_changes("greeting_history"))
+    if "threadline_backfills" in changed_fields:
+        # 実行中のバックフィルは、所有者が変わったり削除されたりしたことを次のメッセージの処理前に検知して止まる
+        apply_map_changes(threadline_backfills, *field_changes("threadline_backfills"))
+
+    # 一番乗りの状態と今日の記録を、反映後のデータに合わせる
+    today_str = datetime.now(timezone(timedelta(hours=9))).date().isoformat()
+    first_new_year_message_sent_today = today_str in first_akeome_winners
+    for uid, ts in akeome_history.get(today_str, {}).items():
+        if isinstance(ts, datetime) and (uid not in akeome_records or ts < akeome_records[uid]):
+            akeome_records[uid] = ts
+
+    print(f"[状態同期] スナップショットの変更を反映しました: {', '.join(changed_fields)}")
+
+def on_state_snapshot(doc_snapshots, changes, read_time):
+    """Firestoreのスナップショット受信時に呼ばれます。（Firestoreのスレッド上で実行）"""
+    existing_docs = [doc for doc in doc_snapshots if doc.exists]
+    if not existing_docs:
+        client.loop.call_soon_threadsafe(handle_missing_state_document)
+        return
+    for doc in existing_docs:
+        client.loop.call_soon_threadsafe(apply_remote_state, doc.to_dict(), get_update_key(doc.update_time))
+
+def handle_missing_state_document():
+    """状態ドキュメントが存在しない場合、まだ保存を始めていなければ現在の状態で作成します。（イベントループ上で実行）"""
+    if not state_writes_enabled:
+        client.loop.create_task(create_state_document_async())
+
+def start_state_listener() -> bool:
+    """状態ドキュメントのスナップショットリスナーを開始します。開始できた（動いている）場合は True を返します。"""
+    global state_listener
+    if state_listener is not None:
+        return True
+    try:
+        state_listener = bot_data_ref.on_snapshot(on_state_snapshot)
+        print("[状態同期] Firestoreのスナップショットリスナーを開始しました。")
+        return True
+    except Exception as e:
+        print(f"[状態同期] スナップショットリスナーの開始中にエラー: {e}")
+        return False
 
 # ---------- スレッド関連 ----------
-async def unarchive_thread_if_needed(thread: discord.Thread):
+async def unarchive_thread_if_needed(thread: discord.Thread) -> bool:
+    """アーカイブされていれば解除します。解除できた場合は True を返します。"""
     if not thread.guild or not isinstance(thread.parent, discord.abc.GuildChannel):
-        return
+        return False
 
     can_manage_threads = await check_bot_permission(thread.guild, thread.parent, "manage_threads")
     if not can_manage_threads:
-        return 
+        return False
 
     if thread.archived:
         try:
             await thread.edit(archived=False)
             print(f"スレッド '{thread.name}' (ID: {thread.id}) のアーカイブを解除しました。")
+            return True
         except discord.NotFound:
             print(f"スレッド '{thread.name}' (ID: {thread.id}) は見つかりませんでした（アーカイブ解除試行時）。")
         except discord.Forbidden:
             print(f"スレッド '{thread.name}' (ID: {thread.id}) のアーカイブを解除する権限がありません（Forbidden）。")
         except Exception as e:
             print(f"スレッド '{thread.name}' (ID: {thread.id}) のアーカイブ解除中にエラー: {e}")
+    return False
+
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+# ★ 追加: スレッド延命（キープアライブ）
+# ★ アーカイブイベントのたびに解除するのではなく、アーカイブ予定時刻が
+# ★ 近いスレッドから順に、1回あたりの上限数を守って事前に延命します。
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+def rebuild_thread_keepalive_heap():
+    """thread_keepalive_index からアーカイブ予定時刻順のヒープを作り直します。"""
+    global thread_keepalive_heap
+    thread_keepalive_heap = [(entry[1], thread_id_str) for thread_id_str, entry in thread_keepalive_index.items()]
+    heapq.heapify(thread_keepalive_heap)
+
+def register_keepalive_thread(thread: discord.Thread, last_active_ts: float = None, timer_reset_ts: float = None):
+    """
+    スレッドを延命対象として登録（または予定時刻を更新）します。
+    アーカイブ予定時刻は、最後の発言(last_active_ts)と、アーカイブのタイマーが最後にリセットされた時刻
+    (timer_reset_ts: スレッド作成・延命・アーカイブ解除)の遅い方から数えます。
+    """
+    now_ts = datetime.now(timezone.utc).timestamp()
+    if last_active_ts is None:
+        last_active_ts = now_ts
+    # 最後の発言から既に延命期間を過ぎているスレッド（過去のメッセージから作ったものなど）は登録しない
+    if now_ts - last_active_ts > THREAD_KEEPALIVE_MAX_IDLE_DAYS * 86400:
+        return
+    duration_minutes = thread.auto_archive_duration or 10080
+    deadline_ts = int(max(last_active_ts, timer_reset_ts or 0) + duration_minutes * 60)
+    thread_id_str = str(thread.id)
+    thread_keepalive_index[thread_id_str] = [thread.guild.id, deadline_ts, int(last_active_ts)]
+    heapq.heappush(thread_keepalive_heap, (deadline_ts, thread_id_str))
+    thread_keepalive_dirty_ids.add(thread_id_str)
+    # 発言のたびに積まれる古いエントリが増えすぎたら作り直す
+    if len(thread_keepalive_heap) > 2 * len(thread_keepalive_index) + 1024:
+        rebuild_thread_keepalive_heap()
+
+def forget_keepalive_thread(thread_id_str: str):
+    """スレッドを延命対象から外します（ヒープ側は取り出し時に読み飛ばされます）。"""
+    if thread_keepalive_index.pop(thread_id_str, None) is not None:
+        thread_keepalive_dirty_ids.add(thread_id_str)
+
+def seed_keepalive_threads():
+    """キャッシュ済みのアクティブスレッドのうち、Botが作成したものを登録します。"""
+    added = 0
+    for guild in client.guilds:
+        for thread in guild.threads:
+            if thread.owner_id != client.user.id or str(thread.id) in thread_keepalive_index:
+                continue
+            if str(thread.parent_id) not in threadline_settings:
+                continue
+            last_active_ts = None
+            if thread.last_message_id:
+                last_active_ts = discord.utils.snowflake_time(thread.last_message_id).timestamp()
+            # archive_timestamp はアーカイブ状態が最後に変わった（タイマーがリセットされた）時刻
+            timer_reset_ts = thread.archive_timestamp.timestamp() if thread.archive_timestamp else None
+            register_keepalive_thread(thread, last_active_ts, timer_reset_ts)
+            added += 1
+    if added:
+        print(f"[スレッド延命] 既存のスレッド {added} 件を延命対象に登録しました。")
+
+async def bump_keepalive_thread(thread_id_str: str) -> bool:
+    """スレッドを1件延命します。API呼び出しを行った場合は True を返します。"""
+    entry = thread_keepalive_index.get(thread_id_str)
+    if not entry:
+        return False
+    guild_id, _, last_active_ts = entry
+    now_ts = datetime.now(timezone.utc).timestamp()
+
+    if now_ts - last_active_ts > THREAD_KEEPALIVE_MAX_IDLE_DAYS * 86400:
+        print(f"[スレッド延命] スレッド (ID: {thread_id_str}) は {THREAD_KEEPALIVE_MAX_IDLE_DAYS} 日以上発言がないため延命を終了します。")
+        forget_keepalive_thread(thread_id_str)
+        return False
+
+    guild = client.get_guild(guild_id)
+    thread = guild.get_thread(int(thread_id_str)) if guild else None
+    if thread is None:
+        try:
+            thread = await client.fetch_channel(int(thread_id_str))
+        except (discord.NotFound, discord.Forbidden):
+            forget_keepalive_thread(thread_id_str)
+            return True
+        except Exception as e:
+            print(f"[スレッド延命] スレッド (ID: {thread_id_str}) の取得中にエラー: {e}")
+            return True
+    if not isinstance(thread, discord.Thread) or thread.locked:
+        forget_keepalive_thread(thread_id_str)
+        return False
+
+    if not await check_bot_permission(thread.guild, thread.parent, "manage_threads"):
+        forget_keepalive_thread(thread_id_str)
+        return False
+
+    # auto_archive_duration を 1週間 ⇔ 3日 で切り替えると、アーカイブまでのタイマーがリセットされる
+    new_duration = 4320 if thread.auto_archive_duration == 10080 else 10080
+    try:
+        thread = await thread.edit(archived=False, auto_archive_duration=new_duration)
+        register_keepalive_thread(thread, last_active_ts, datetime.now(timezone.utc).timestamp())
+        print(f"[スレッド延命] スレッド '{thread.name}' (ID: {thread.id}) を延命しました。")
+    except discord.NotFound:
+        forget_keepalive_thread(thread_id_str)
+    except discord.Forbidden:
+        print(f"[スレッド延命] スレッド '{thread.name}' (ID: {thread.id}) を延命する権限がありません（Forbidden）。")
+        forget_keepalive_thread(thread_id_str)
+    except Exception as e:
+        print(f"[スレッド延命] スレッド '{thread.name}' (ID: {thread.id}) の延命中にエラー: {e}")
+    return True
+
+async def thread_keepalive_loop():
+    await client.wait_until_ready()
+    while not client.is_closed():
+        try:
+            now_ts = datetime.now(timezone.utc).timestamp()
+            bumped = 0
+            retry_ids = []
+            while thread_keepalive_heap and bumped < THREAD_KEEPALIVE_BATCH_SIZE:
+                deadline_ts, thread_id_str = thread_keepalive_heap[0]
+                if deadline_ts - now_ts > THREAD_KEEPALIVE_MARGIN:
+                    break
+                heapq.heappop(thread_keepalive_heap)
+                entry = thread_keepalive_index.get(thread_id_str)
+                if not entry or entry[1] != deadline_ts:
+                    continue  # 既に更新・削除済みの古いエントリ
+                if await bump_keepalive_thread(thread_id_str):
+                    bumped += 1
+                    await asyncio.sleep(THREAD_KEEPALIVE_EDIT_DELAY)
+                # 一時的なエラーで延命できなかったものは次回のチェックで再試行する
+                entry = thread_keepalive_index.get(thread_id_str)
+                if entry and entry[1] == deadline_ts:
+                    retry_ids.append(thread_id_str)
+
+            for thread_id_str in retry_ids:
+                entry = thread_keepalive_index.get(thread_id_str)
+                if entry:
+                    heapq.heappush(thread_keepalive_heap, (entry[1], thread_id_str))
+
+            if bumped:
+                print(f"[スレッド延命] {bumped} 件のスレッドを処理しました。（管理中: {len(thread_keepalive_index)} 件）")
+            if thread_keepalive_dirty_ids:
+                updates = {}
+                for thread_id_str in thread_keepalive_dirty_ids:
+                    entry = thread_keepalive_index.get(thread_id_str)
+                    updates[state_path("thread_keepalive", thread_id_str)] = list(entry) if entry else google_firestore.DELETE_FIELD
+                thread_keepalive_dirty_ids.clear()
+                await save_data_async(updates)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            print(f"[スレッド延命 エラー] {e}")
+        await asyncio.sleep(THREAD_KEEPALIVE_INTERVAL)
 
 @client.event
 async def on_thread_update(before: discord.Thread, after: discord.Thread):
     if before.archived and not after.archived: 
         return
-    if not before.archived and after.archived: 
-        await unarchive_thread_if_needed(after)
+    # 延命が間に合わずアーカイブされた管理対象スレッドのみ、その場で解除する
+    if not before.archived and after.archived and str(after.id) in thread_keepalive_index:
+        if await unarchive_thread_if_needed(after):
+            # 解除した時点からアーカイブのタイマーが数え直されるので、予定時刻を更新する
+            entry = thread_keepalive_index.get(str(after.id))
+            if entry:
+                register_keepalive_thread(after, entry[2], datetime.now(timezone.utc).timestamp())
+
+@client.event
+async def on_thread_delete(thread: discord.Thread):
+    forget_keepalive_thread(str(thread.id))
+
+# ---------- スラッシュコマンド同期 ----------
+def compute_command_tree_hash(guild: discord.abc.Snowflake = None) -> str:
+    """コマンドツリーの定義（名前・説明・引数など）から安定したハッシュを計算します。"""
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands(guild=guild)), key=lambda d: (d.get("type", 1), d["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+async def sync_commands_if_changed():
+    """
+    コマンド定義のハッシュが前回の同期時から変わっている場合のみ tree.sync() を行います。
+    DEV_GUILD_ID が設定されていれば、グローバルコマンドをそのサーバーにコピーして、そのサーバーだけに同期します。
+    （グローバルにも同期すると、そのサーバーでは同じコマンドが2つずつ表示されるため）
+    """
+    if DEV_GUILD_ID:
+        dev_guild = discord.Object(id=int(DEV_GUILD_ID))
+        tree.copy_global_to(guild=dev_guild)
+        targets = [(DEV_GUILD_ID, dev_guild)]
+    else:
+        targets = [("global", None)]
+
+    hash_updates = {}
+    for hash_key, guild in targets:
+        label = "グローバル" if guild is None else f"サーバー {hash_key}"
+        try:
+            current_hash = compute_command_tree_hash(guild)
+        except Exception as e:
+            print(f"スラッシュコマンド定義のハッシュ計算中にエラー: {e}")
+            current_hash = None
+        if current_hash and command_sync_hashes.get(hash_key) == current_hash:
+            print(f"スラッシュコマンド（{label}）に変更がないため同期をスキップしました。")
+            continue
+
+        sync_started = perf_counter()
+        try:
+            synced = await tree.sync(guild=guild)
+            elapsed_ms = (perf_counter() - sync_started) * 1000
+            if synced:
+                print(f"{len(synced)}個のスラッシュコマンド（{label}）を同期しました ({elapsed_ms:.1f}ms): {[s.name for s in synced]}")
+            else:
+                print(f"スラッシュコマンド（{label}）の同期対象がありませんでした。({elapsed_ms:.1f}ms)")
+            if current_hash:
+                command_sync_hashes[hash_key] = current_hash
+                hash_updates[state_path("command_sync_hashes", hash_key)] = current_hash
+        except Exception as e:
+            print(f"スラッシュコマンド（{label}）同期中にエラー: {e}")
+
+    # 状態を読み込めていない場合、ハッシュが空なのは前回の記録が無いからとは限らないので保存しない
+    if not state_load_ok:
+        if hash_updates:
+            print("状態の読み込みに失敗しているため、スラッシュコマンドのハッシュは保存しません。")
+        return
+    # ハッシュのフィールドだけを書き込む
+    await save_data_async(hash_updates)
 
 # ---------- 定期処理 ----------
 @client.event
 async def on_ready():
     global first_new_year_message_sent_today
     print(f"--- {client.user.name} (ID: {client.user.id}) 準備完了 ---")
-    try:
-        synced = await tree.sync()
-        if synced:
-            print(f"{len(synced)}個のスラッシュコマンドを同期しました: {[s.name for s in synced]}")
-        else:
-            print("スラッシュコマンドの同期対象がありませんでした。")
-    except Exception as e:
-        print(f"スラッシュコマンド同期中にエラー: {e}")
-    
-    await load_data_async()
+
+    # スナップショットリスナーが動いていれば状態は最新なので、再接続時の再読み込みは不要
+    if state_listener is None:
+        load_started = perf_counter()
+        load_source = None
+        # ローカルスナップショットがあればそれを使って即座に動き始め、
+        # Firestoreとの差分はスナップショットリスナーの初回通知で反映する。
+        # 一度状態を展開した後（再接続時）は、メモリ上の状態を古いスナップショットで上書きしない
+        if not state_load_ok:
+            if load_local_snapshot():
+                load_source = "ローカルスナップショット"
+            else:
+                await load_data_async()
+                load_source = "Firestore"
+        # リスナーを開始できず、まだFirestoreの状態を確認できていない場合は、直接読み込んで保存を始める
+        if not start_state_listener() and not state_writes_enabled:
+            await load_data_async()
+            load_source = "Firestore"
+        if load_source is not None:
+            print(f"[起動時間] 状態の読み込み: {(perf_counter() - load_started) * 1000:.1f}ms (読み込み元: {load_source})")
+
+    # 前回の同期からコマンド定義が変わっている場合のみ同期する（状態の読み込み後に行う）
+    await sync_commands_if_changed()
 
     now = datetime.now(timezone(timedelta(hours=9)))
     date_str = now.date().isoformat()
@@ -269,12 +828,21 @@ async def on_ready():
     print(f"本日の「あけおめ」一番乗りフラグ: {first_new_year_message_sent_today} (日付: {date_str})")
 
 
+    seed_keepalive_threads()
+    if backfill_resume_handle is not None:
+        backfill_resume_handle.cancel()
+    resume_threadline_backfills()
+
     if not client.presence_task_started:
+        if WORKER_PROCESSES > 0:
+            started = await start_workers(WORKER_PROCESSES)
+            print(f"[ワーカー] ワーカープロセスを {started} 個起動しました。")
         client.loop.create_task(update_presence_periodically())
+        client.loop.create_task(thread_keepalive_loop())
         client.loop.create_task(reset_daily_flags_at_midnight())
         client.loop.create_task(reset_yearly_records_on_anniversary())
         client.presence_task_started = True
-    print("--- 初期化処理完了 ---")
+    print(f"--- 初期化処理完了 (起動から {perf_counter() - PROCESS_START:.2f} 秒) ---")
 
 async def update_presence_periodically():
     await client.wait_until_ready() 
@@ -362,11 +930,7 @@ async def reset_yearly_records_on_anniversary():
         if last_akeome_channel_id and first_akeome_winners: 
             target_channel = client.get_channel(last_akeome_channel_id)
             if target_channel and isinstance(target_channel, discord.TextChannel):
-                yearly_winner_counts = {}
-                for yearly_winner_id_str in first_akeome_winners.values(): 
-                    yearly_winner_counts[yearly_winner_id_str] = yearly_winner_counts.get(yearly_winner_id_str, 0) + 1
-                
-                yearly_sorted_counts = sorted(yearly_winner_counts.items(), key=lambda item: item[1], reverse=True)
+                yearly_sorted_counts = count_winners(first_akeome_winners)
 
                 def get_yearly_winner_name(uid_str, guild_ctx): 
                     try:
@@ -397,7 +961,45 @@ async def reset_yearly_records_on_anniversary():
         new_start_date = next_reset_anniversary_jst.date() 
         print(f"[年間リセット] 一番乗り記録をクリアしました。新しい開始日: {new_start_date.isoformat()}")
         start_date = new_start_date 
-        await save_data_async()
+        await save_data_async({"first_akeome_winners": {}, "start_date": start_date.isoformat()})
+
+# ---------- あいさつキーワード ----------
+def get_greeting_matcher(guild_id: int) -> dict:
+    """サーバーの有効なキーワード（「あけおめ」＋独自キーワード）の判定器を返します。"""
+    guild_id_str = str(guild_id)
+    matcher = greeting_matchers.get(guild_id_str)
+    if matcher is None:
+        keywords = [(NEW_YEAR_WORD, MATCH_EXACT)] + list(greeting_settings.get(guild_id_str, {}).items())
+        matcher = build_greeting_matcher(keywords)
+        greeting_matchers[guild_id_str] = matcher
+    return matcher
+
+async def handle_custom_greeting(message: discord.Message, keyword: str) -> dict:
+    """独自キーワードの記録と、キーワードごとの一番乗り判定を行い、保存するフィールドを返します。"""
+    guild_id_str = str(message.guild.id)
+    author_id_str = str(message.author.id)
+    now_jst = datetime.now(timezone(timedelta(hours=9)))
+    current_date_str = now_jst.date().isoformat()
+
+    today_records = greeting_history.setdefault(guild_id_str, {}).setdefault(keyword, {}).setdefault(current_date_str, {})
+    if author_id_str in today_records:
+        return {}
+    today_records[author_id_str] = now_jst
+    updates = {state_path("greeting_history", guild_id_str, keyword, current_date_str, author_id_str): now_jst}
+    print(f"[あいさつ記録] '{message.author.name}' が '{message.guild.name}' で「{keyword}」しました。")
+
+    keyword_winners = greeting_winners.setdefault(guild_id_str, {}).setdefault(keyword, {})
+    if current_date_str not in keyword_winners:
+        keyword_winners[current_date_str] = author_id_str
+        updates[state_path("greeting_winners", guild_id_str, keyword, current_date_str)] = author_id_str
+        print(f"[あいさつ一番乗り] 「{keyword}」の一番乗り: {message.author.name}")
+        if await check_bot_permission(message.guild, message.channel, "send_messages"):
+            try:
+                await message.reply(f"{message.author.mention} が「{keyword}」一番乗り！")
+            except Exception as e_send:
+                print(f"あいさつ一番乗りメッセージ送信中にエラー: {e_send}。チャンネル: '{message.channel.name}'")
+
+    return updates
 
 # ---------- メッセージ処理 ----------
 @client.event
@@ -406,12 +1008,28 @@ async def on_message(message: discord.Message):
 
     if message.author == client.user or message.author.bot: 
         return
+
+    # 延命対象スレッドでの発言は最終発言時刻として記録し、アーカイブ予定時刻もそこから数え直す。
+    # 延命対象から外れていた（過去のメッセージから作った）スレッドも、発言があれば登録する
+    if isinstance(message.channel, discord.Thread):
+        thread = message.channel
+        if str(thread.id) in thread_keepalive_index or (thread.owner_id == client.user.id and str(thread.parent_id) in threadline_settings):
+            register_keepalive_thread(thread, message.created_at.timestamp())
+        return
     
     if not message.guild or not isinstance(message.channel, discord.TextChannel): 
         return
     
+    # --- あいさつキーワード判定（全キーワードを1回の走査で判定） ---
+    matched_greetings = match_greetings(get_greeting_matcher(message.guild.id), message.content)
+    custom_greetings = [(keyword, mode) for keyword, mode in matched_greetings if keyword != NEW_YEAR_WORD]
+    greeting_updates = {}
+    for keyword, _ in custom_greetings:
+        greeting_updates.update(await handle_custom_greeting(message, keyword))
+    await save_data_async(greeting_updates)
+
     # --- 「あけおめ」機能 (最優先で処理) ---
-    if message.content.strip() == NEW_YEAR_WORD:
+    if (NEW_YEAR_WORD, MATCH_EXACT) in matched_greetings:
         
         # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
         # ★ デバッグログ追加
@@ -422,6 +1040,8 @@ async def on_message(message: discord.Message):
         current_date_str = now_jst.date().isoformat()
         last_akeome_channel_id = message.channel.id
         author_id_str = str(message.author.id) 
+        # 保存するフィールド（変更のあったものだけ）
+        updates = {}
 
         # 今日のローカル記録に保存
         if author_id_str not in akeome_records: 
@@ -432,8 +1052,8 @@ async def on_message(message: discord.Message):
             if current_date_str not in akeome_history:
                 akeome_history[current_date_str] = {}
             akeome_history[current_date_str][author_id_str] = now_jst
+            updates[state_path("akeome_history", current_date_str, author_id_str)] = now_jst
         
-        data_changed = False
         
         # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
         # ★ デバッグログ追加
@@ -459,21 +1079,28 @@ async def on_message(message: discord.Message):
             
             first_new_year_message_sent_today = True
             first_akeome_winners[current_date_str] = author_id_str
-            data_changed = True
+            updates[state_path("first_akeome_winners", current_date_str)] = author_id_str
             print(f"[あけおめ一番乗り] フラグを True に設定しました。勝者: {message.author.name}")
 
             
             if start_date is None: 
                 start_date = now_jst.date() 
                 print(f"初回の「あけおめ」記録。年間リセットの基準日を {start_date.isoformat()} に設定しました。")
+                updates["start_date"] = start_date.isoformat()
         
         # 履歴が更新されたか、新規の一番乗りが出た場合にデータを保存
-        if data_changed or author_id_str not in akeome_history.get(current_date_str, {}):
+        if updates:
+            updates["last_akeome_channel_id"] = last_akeome_channel_id
             print("[あけおめ保存] データベースへの保存処理を呼び出します。")
-            await save_data_async()
+            await save_data_async(updates)
         
         return # 「あけおめ」処理が終わったら他の処理はしない
 
+    # メッセージ全体がキーワードのもの（あいさつだけのメッセージ）はスレッドにしない。
+    # 部分一致のキーワードを含むだけのメッセージは、通常どおりスレッド作成の対象にする
+    if any(mode == MATCH_EXACT for _, mode in custom_greetings):
+        return
+
     # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
     # ★ 変更: 新しい設定ベースの自動スレッド作成機能 (ロジック修正済み)
     # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
@@ -490,144 +1117,104 @@ async def on_message(message: discord.Message):
     if not can_create_threads:
         return
 
-    message_type = None
-    thread_name = ""
-    reaction_emoji = None
-
-    # --- テキストからスレッド名を生成するヘルパー関数 ---
-    def get_thread_name_from_text(content: str) -> str:
-        """ メッセージ内容からスレッド名を生成します。 """
-        # マークダウン（太字・斜体）を除去
-        cleaned_content = re.sub(r'(\*{1,3}|__)(.*?)\1', r'\2', content)
-        # 見出し記号（行頭の#）を除去
-        cleaned_content = re.sub(r'^\s*#{1,3}\s+', '', cleaned_content)
-        # ★ 修正: 最初の「全角スペース」までを取得（半角スペースは許可）
-        title_candidate = re.split(r'　', cleaned_content, 1)[0]
-        # 80文字に制限し、前後の空白を除去
-        temp_name = title_candidate[:80].strip()
-        # ファイル名に使えない文字を除去
-        temp_name = re.sub(r'[\\/*?"<>|:]', '', temp_name)
-        # 結果が空ならデフォルト名を返す
-        return temp_name if temp_name else "関連スレッド"
-
-    # --- 各要素の存在確認 ---
-    is_poll = "poll" in enabled_types and message.poll
-    is_media = "media" in enabled_types and message.attachments and any(att.content_type and att.content_type.startswith(('image/', 'video/')) for att in message.attachments)
-    # media と file が重複しないように
-    is_file = "file" in enabled_types and message.attachments and not is_media
-    is_link = "link" in enabled_types and re.search(r'httpsS?://\S+', message.content)
-    
-    cleaned_content_for_check = message.content.strip()
-    
-    # ★ 変更: テキストが「存在するか」の判定 (設定に依存しない)
-    has_valid_text = (
-        cleaned_content_for_check and  # 空白のみを除外
-        not message.poll and 
-        not cleaned_content_for_check.startswith(BOT_COMMAND_PREFIXES) and 
-        not (cleaned_content_for_check.startswith('#') and not cleaned_content_for_check.startswith('# '))
-    )
-    
-    # ★ 変更: 「テキスト単体」でのスレッド作成（message=True の場合）の判定
-    is_text_message_only = (
-        "message" in enabled_types and
-        has_valid_text and
-        not is_poll and
-        not is_media and
-        not is_file and
-        not is_link # 他のタイプが含まれていないことを確認
-    )
-
-
-    # --- 優先度（リアクションとデフォルト名）の決定 ---
-    if is_poll:
-        message_type = "poll"
-        poll_question_text = "投票"
-        if hasattr(message.poll, 'question'):
-            if isinstance(message.poll.question, str):
-                poll_question_text = message.poll.question
-            elif hasattr(message.poll.question, 'text') and isinstance(message.poll.question.text, str):
-                poll_question_text = message.poll.question.text
-        
-        temp_name = poll_question_text[:100].strip()
-        # ★ 修正: 最初の「全角スペース」で分割
-        fullwidth_space_match = re.search(r'　', temp_name)
-        if fullwidth_space_match:
-            temp_name = temp_name[:fullwidth_space_match.start()].strip()
-        thread_name = temp_name if temp_name else "投票に関するスレッド"
-        reaction_emoji = "✅"
-    
-    elif is_media:
-        message_type = "media"
-        thread_name = f"{message.author.display_name}さんのメディア投稿"
-        reaction_emoji = "🖼️"
-
-    elif is_file:
-        message_type = "file"
-        thread_name = message.attachments[0].filename or f"{message.author.display_name}さんの添付ファイル"
-        thread_name = thread_name[:100].strip()
-        reaction_emoji = "📎"
-
-    elif is_link:
-        message_type = "link"
-        thread_name = message.content.split('\n')[0][:80].strip() or "リンクに関する話題"
-        reaction_emoji = "🔗"
-
-    elif is_text_message_only: # ★ 変更: is_text_message -> is_text_message_only
-        message_type = "message"
-        thread_name = get_thread_name_from_text(message.content)
-        reaction_emoji = "💬"
-
-    # --- スレッド名のオーバーライド（要求された機能） ---
-    # テキストがあり、かつ優先タイプが「メディア」「ファイル」「リンク」の場合、
-    # スレッド名をテキストベースのものに上書きする
-    if has_valid_text and message_type in ["media", "file", "link"]: # ★ 変更: is_text_message -> has_valid_text
-        thread_name = get_thread_name_from_text(message.content)
+    # --- スレッドの種類・名前の判定 ---
+    message_event = normalize_message_event(message, enabled_types)
+    message_type, thread_name, reaction_emoji = await run_task(classify_thread_message, message_event)
 
     # --- スレッド作成の実行 ---
     if message_type:
-        try:
-            await message.create_thread(name=thread_name, auto_archive_duration=10080)
-            print(f"{message_type} からスレッドを作成: '{thread_name}' (チャンネル: {message.channel.name})")
-
-            if reaction_emoji:
-                can_add_reactions = await check_bot_permission(message.guild, message.channel, "add_reactions")
-                if can_add_reactions:
-                    await message.add_reaction(reaction_emoji)
-        except discord.errors.HTTPException as e:
-            if e.status == 400 and hasattr(e, 'code') and e.code == 50035:
-                print(f"スレッド作成失敗(400/50035): スレッド名「{thread_name}」が無効の可能性。詳細: {e.text if hasattr(e, 'text') else e}")
-            else:
-                print(f"スレッド作成/リアクション中にHTTPエラー: {e} (チャンネル: {message.channel.name})")
-        except Exception as e:
-            print(f"スレッド作成/リアクション中に予期せぬエラー: {e} (チャンネル: {message.channel.name})")
+        await create_auto_thread(message, message_type, thread_name, reaction_emoji)
+
+async def create_auto_thread(message: discord.Message, message_type: str, thread_name: str, reaction_emoji: str) -> bool:
+    """メッセージからスレッドを作成し、リアクションを付けます。作成できた場合は True を返します。"""
+    try:
+        created_thread = await message.create_thread(name=thread_name, auto_archive_duration=10080)
+        print(f"{message_type} からスレッドを作成: '{thread_name}' (チャンネル: {message.channel.name})")
+        # 最終発言は元のメッセージの投稿日時、アーカイブのタイマーは作成した今から数える（バックフィルで作った古いスレッドを延命し続けないため）
+        register_keepalive_thread(created_thread, message.created_at.timestamp(), datetime.now(timezone.utc).timestamp())
+        remember_auto_thread(message.id, created_thread.id, message_type)
+
+        if reaction_emoji:
+            can_add_reactions = await check_bot_permission(message.guild, message.channel, "add_reactions")
+            if can_add_reactions:
+                await message.add_reaction(reaction_emoji)
+        return True
+    except discord.errors.HTTPException as e:
+        if e.status == 400 and hasattr(e, 'code') and e.code == 50035:
+            print(f"スレッド作成失敗(400/50035): スレッド名「{thread_name}」が無効の可能性。詳細: {e.text if hasattr(e, 'text') else e}")
+        else:
+            print(f"スレッド作成/リアクション中にHTTPエラー: {e} (チャンネル: {message.channel.name})")
+    except Exception as e:
+        print(f"スレッド作成/リアクション中に予期せぬエラー: {e} (チャンネル: {message.channel.name})")
+    return False
+
+
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+# ★ 変更: リアクション処理
+# ★ 絵文字・対象チャンネル・自動スレッド化済みメッセージで先に絞り込み、
+# ★ キャッシュだけで必要な情報が揃った場合にのみハンドラを呼び出します。
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+def remember_auto_thread(message_id: int, thread_id: int, message_type: str):
+    """自動スレッド化したメッセージを記録します（古いものから破棄）。"""
+    recent_auto_threads[message_id] = (thread_id, message_type)
+    recent_auto_threads.move_to_end(message_id)
+    while len(recent_auto_threads) > RECENT_AUTO_THREADS_MAX:
+        recent_auto_threads.popitem(last=False)
+
+async def handle_poll_reaction(guild: discord.Guild, member: discord.Member, thread_id: int, message_type: str):
+    """投票メッセージに✅を付けた人を、その投票のスレッドに参加させます。"""
+    if message_type != "poll":
+        return
+    thread = guild.get_thread(thread_id)
+    if thread is None or thread.archived:
+        return
+    if not await check_bot_permission(guild, thread.parent, "send_messages_in_threads"):
+        return
+    try:
+        await thread.add_user(member)
+        print(f"[リアクション] '{member.display_name}' を投票スレッド '{thread.name}' に追加しました。")
+    except (discord.NotFound, discord.Forbidden):
+        pass
+    except Exception as e:
+        print(f"[リアクション] 投票スレッドへのメンバー追加中にエラー: {e}")
 
+# 絵文字 -> ハンドラ
+REACTION_HANDLERS = {
+    "✅": handle_poll_reaction,
+}
 
 @client.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     if not payload.guild_id: 
         return
-    
+    if client.user and payload.user_id == client.user.id:
+        return
+
+    handler = REACTION_HANDLERS.get(payload.emoji.name)
+    if handler is None:
+        return
+    if str(payload.channel_id) not in threadline_settings:
+        return
+    auto_thread = recent_auto_threads.get(payload.message_id)
+    if auto_thread is None:
+        return
+
     guild = client.get_guild(payload.guild_id)
     if not guild: return 
-    
-    try:
-        member = payload.member or await guild.fetch_member(payload.user_id)
-    except (discord.NotFound, discord.HTTPException): return
 
+    member = payload.member or guild.get_member(payload.user_id)
     if not member or member.bot: return
 
-    if payload.emoji.name == "✅": 
-        channel = client.get_channel(payload.channel_id)
-        if isinstance(channel, discord.TextChannel):
-            try:
-                message = await channel.fetch_message(payload.message_id)
-            except (discord.NotFound, discord.Forbidden): return
-            except Exception as e:
-                print(f"リアクションからのメッセージ取得エラー: {e}")
-                return
+    recent_auto_threads.move_to_end(payload.message_id)
+    thread_id, message_type = auto_thread
+    await handler(guild, member, thread_id, message_type)
 
 
 # ---------- スラッシュコマンド ----------
+def format_jst_time(ts: datetime) -> str:
+    """記録の日時を日本時間の「時:分:秒.ミリ秒」にします。（記録はUTCのまま保持している）"""
+    return ts.astimezone(timezone(timedelta(hours=9))).strftime('%H:%M:%S.%f')[:-3]
+
 @tree.command(name="akeome_top", description="今日の「あけおめ」トップ10と自分の順位を表示します。")
 @app_commands.describe(another="他の集計結果も表示できます（オプション）")
 @app_commands.choices(another=[
@@ -663,8 +1250,8 @@ async def akeome_top_command(interaction: discord.Interaction, another: app_comm
         if not akeome_records:
             embed.description = "今日はまだ誰も「あけおめ」していません！"
         else:
-            sorted_today = sorted(akeome_records.items(), key=lambda item: item[1])
-            lines = [format_user_line(i+1, uid, ts.strftime('%H:%M:%S.%f')[:-3]) for i, (uid, ts) in enumerate(sorted_today[:10])]
+            sorted_today = rank_entries(akeome_records)
+            lines = [format_user_line(i+1, uid, format_jst_time(ts)) for i, (uid, ts) in enumerate(sorted_today[:10])]
             
             user_id_str_cmd = str(interaction.user.id)
             if user_id_str_cmd in akeome_records:
@@ -675,7 +1262,7 @@ async def akeome_top_command(interaction: discord.Interaction, another: app_comm
                         break
                 if user_rank != -1 and user_rank > 10: 
                     lines.append("...")
-                    lines.append(format_user_line(user_rank, user_id_str_cmd, akeome_records[user_id_str_cmd].strftime('%H:%M:%S.%f')[:-3]))
+                    lines.append(format_user_line(user_rank, user_id_str_cmd, format_jst_time(akeome_records[user_id_str_cmd])))
             else:
                 lines.append("\nあなたは今日まだ「あけおめ」していません。")
             embed.description = "\n".join(lines) if lines else "記録がありません。"
@@ -685,11 +1272,7 @@ async def akeome_top_command(interaction: discord.Interaction, another: app_comm
         if not first_akeome_winners:
             embed.description = "まだ一番乗りの記録がありません。"
         else:
-            winner_counts = {}
-            for uid_winner in first_akeome_winners.values():
-                winner_counts[uid_winner] = winner_counts.get(uid_winner, 0) + 1
-            
-            sorted_past = sorted(winner_counts.items(), key=lambda item: item[1], reverse=True)
+            sorted_past = count_winners(first_akeome_winners)
             lines = [format_user_line(i+1, uid, f"{count} 回", "🏆") for i, (uid, count) in enumerate(sorted_past[:10])]
             embed.description = "\n".join(lines) if lines else "記録がありません。"
             if start_date and first_akeome_winners:
@@ -708,13 +1291,227 @@ async def akeome_top_command(interaction: discord.Interaction, another: app_comm
         if not today_history:
             embed.description = "今日の「あけおめ」記録がありません。"
         else:
-            sorted_worst = sorted(today_history.items(), key=lambda item: item[1], reverse=True)
-            lines = [format_user_line(i+1, uid, ts.strftime('%H:%M:%S.%f')[:-3], "🐌") for i, (uid, ts) in enumerate(sorted_worst[:10])]
+            sorted_worst = rank_entries(today_history, True)
+            lines = [format_user_line(i+1, uid, format_jst_time(ts), "🐌") for i, (uid, ts) in enumerate(sorted_worst[:10])]
             embed.description = "\n".join(lines) if lines else "記録がありません。"
             
     await interaction.followup.send(embed=embed)
 
 
+def get_akeome_stats(today_date):
+    """
+    あけおめ統計を返します。過去分の列データは日付が変わるまでキャッシュし、
+    今日の記録だけを追加して集計し直します（今日の記録数が変わらなければ集計結果もそのまま使う）。
+    """
+    today_str = today_date.isoformat()
+    past_key = (today_str, len(akeome_history) - (1 if today_str in akeome_history else 0))
+    if akeome_stats_cache.get("past_key") != past_key:
+        past_history = {date_str: recs for date_str, recs in akeome_history.items() if date_str != today_str}
+        akeome_stats_cache["past_columns"] = build_history_columns(past_history)
+        akeome_stats_cache["past_key"] = past_key
+        akeome_stats_cache.pop("stats_key", None)
+
+    today_history = akeome_history.get(today_str, {})
+    stats_key = (past_key, len(today_history))
+    if akeome_stats_cache.get("stats_key") != stats_key:
+        columns = extend_history_columns(akeome_stats_cache["past_columns"], {today_str: today_history})
+        akeome_stats_cache["stats"] = build_stats(columns, today_date.toordinal())
+        akeome_stats_cache["stats_key"] = stats_key
+    return akeome_stats_cache["stats"]
+
+def format_seconds_after_midnight(seconds: float) -> str:
+    return f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:06.3f}"
+
+@tree.command(name="akeome_stats", description="「あけおめ」の統計（連続記録・平均時刻・順位・前年比較）を表示します。")
+@app_commands.describe(user="統計を表示するユーザー（省略時は自分）")
+async def akeome_stats_command(interaction: discord.Interaction, user: discord.Member = None):
+    await interaction.response.defer()
+
+    if not interaction.guild:
+        await interaction.followup.send("このコマンドはサーバー内でのみ使用できます。", ephemeral=True)
+        return
+
+    target = user or interaction.user
+    now_jst_cmd = datetime.now(timezone(timedelta(hours=9)))
+    calc_started = perf_counter()
+    stats = get_akeome_stats(now_jst_cmd.date())
+    summary = summarize_user(stats, str(target.id))
+    streak_ranking = top_streaks(stats)
+    calc_ms = (perf_counter() - calc_started) * 1000
+
+    embed = discord.Embed(title=f"📊 {target.display_name} さんの「あけおめ」統計", color=0xc0c0c0)
+    embed.set_footer(text=f"集計日時: {now_jst_cmd.strftime('%Y年%m月%d日 %H:%M:%S')} ({calc_ms:.1f}ms)")
+
+    if summary is None:
+        embed.description = "まだ「あけおめ」の記録がありません。"
+    else:
+        embed.add_field(name="📅 参加日数", value=f"{summary['count']} 日", inline=True)
+        embed.add_field(name="🔥 連続記録", value=f"現在 {summary['current_streak']} 日 / 最長 {summary['longest_streak']} 日", inline=True)
+        embed.add_field(name="🕒 0時からの時刻", value=f"平均 {format_seconds_after_midnight(summary['mean'])}\n中央値 {format_seconds_after_midnight(summary['median'])}", inline=False)
+        embed.add_field(name="🏅 順位", value=f"上位 {max(1, round((1 - summary['faster_than_ratio']) * 100))}%（中央値で比較）", inline=True)
+
+        yearly_lines = []
+        previous = None
+        for year_stats in summary["yearly"][-3:]:
+            line = f"{year_stats['year']}年: 中央値 {format_seconds_after_midnight(year_stats['median'])} ({year_stats['count']} 日)"
+            if previous:
+                diff = year_stats["median"] - previous["median"]
+                line += f" {'⏩' if diff < 0 else '⏪'} {abs(diff):.1f}秒{'早い' if diff < 0 else '遅い'}"
+            yearly_lines.append(line)
+            previous = year_stats
+        embed.add_field(name="📈 年ごとの比較", value="\n".join(yearly_lines), inline=False)
+
+    if streak_ranking:
+        def get_member_display_name(user_id_str):
+            try:
+                member = interaction.guild.get_member(int(user_id_str))
+                return member.display_name if member else f"ID: {user_id_str}"
+            except (ValueError, TypeError):
+                return f"不明なID: {user_id_str}"
+        streak_lines = [f"{i+1}. {get_member_display_name(uid)} 🔥 {days} 日" for i, (uid, days) in enumerate(streak_ranking)]
+        embed.add_field(name="連続記録ランキング", value="\n".join(streak_lines), inline=False)
+
+    await interaction.followup.send(embed=embed)
+
+
+@tree.command(name="greeting", description="このサーバーのあいさつキーワード（「あけおめ」以外）を設定します。（要サーバー管理権限）")
+@app_commands.describe(
+    action="追加・削除・一覧表示のどれを行うか",
+    keyword="対象のキーワード（例: ことよろ、メリクリ）",
+    match="判定方法 (デフォルト: メッセージ全体が一致)"
+)
+@app_commands.choices(
+    action=[
+        app_commands.Choice(name="追加", value="add"),
+        app_commands.Choice(name="削除", value="remove"),
+        app_commands.Choice(name="一覧", value="list"),
+    ],
+    match=[
+        app_commands.Choice(name="メッセージ全体が一致", value=MATCH_EXACT),
+        app_commands.Choice(name="メッセージに含まれる", value=MATCH_CONTAINS),
+    ]
+)
+@app_commands.checks.has_permissions(manage_guild=True)
+async def greeting_command(interaction: discord.Interaction, action: app_commands.Choice[str], keyword: str = None, match: app_commands.Choice[str] = None):
+    await interaction.response.defer(ephemeral=True)
+
+    if not interaction.guild:
+        await interaction.followup.send("このコマンドはサーバー内でのみ使用できます。")
+        return
+
+    guild_id_str = str(interaction.guild.id)
+    guild_keywords = greeting_settings.get(guild_id_str, {})
+
+    if action.value == "list":
+        lines = [f"- `{NEW_YEAR_WORD}` (標準)"]
+        lines += [f"- `{kw}` ({'全体一致' if mode == MATCH_EXACT else '部分一致'})" for kw, mode in guild_keywords.items()]
+        await interaction.followup.send("📝 このサーバーのあいさつキーワード\n" + "\n".join(lines))
+        return
+
+    keyword = (keyword or "").strip()
+    if not keyword:
+        await interaction.followup.send("⚠️ キーワードを指定してください。")
+        return
+
+    if action.value == "add":
+        normalized = normalize_greeting_text(keyword)
+        existing = [NEW_YEAR_WORD] + list(guild_keywords)
+        if any(normalize_greeting_text(kw) == normalized for kw in existing):
+            await interaction.followup.send(f"ℹ️ 「{keyword}」は既に登録されています。（全角/半角・カタカナ/ひらがなの違いは同じキーワードとして扱います）")
+            return
+        if len(guild_keywords) >= GREETING_MAX_KEYWORDS:
+            await interaction.followup.send(f"⚠️ 登録できるキーワードは {GREETING_MAX_KEYWORDS} 個までです。")
+            return
+        greeting_settings.setdefault(guild_id_str, {})[keyword] = match.value if match else MATCH_EXACT
+        updates = {state_path("greeting_settings", guild_id_str, keyword): greeting_settings[guild_id_str][keyword]}
+        response_message = f"✅ あいさつキーワード「{keyword}」を追加しました。"
+    else:
+        # 追加時と同じく、正規化した形で登録済みのキーワードを探す
+        normalized = normalize_greeting_text(keyword)
+        registered_keyword = next((kw for kw in guild_keywords if normalize_greeting_text(kw) == normalized), None)
+        if registered_keyword is None:
+            await interaction.followup.send(f"ℹ️ 「{keyword}」は登録されていません。")
+            return
+        keyword = registered_keyword
+        del guild_keywords[keyword]
+        if guild_keywords:
+            updates = {state_path("greeting_settings", guild_id_str, keyword): google_firestore.DELETE_FIELD}
+        else:
+            greeting_settings.pop(guild_id_str, None)
+            updates = {state_path("greeting_settings", guild_id_str): google_firestore.DELETE_FIELD}
+        response_message = f"❌ あいさつキーワード「{keyword}」を削除しました。（これまでの記録は残ります）"
+
+    greeting_matchers.pop(guild_id_str, None)
+    await save_data_async(updates)
+    await interaction.followup.send(response_message)
+
+@greeting_command.error
+async def greeting_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("このコマンドを実行するには、サーバーの管理権限が必要です。", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"コマンドの実行中にエラーが発生しました: {error}", ephemeral=True)
+
+
+@tree.command(name="greeting_top", description="あいさつキーワードごとの今日のトップ10と一番乗り回数を表示します。")
+@app_commands.describe(keyword="集計するキーワード")
+async def greeting_top_command(interaction: discord.Interaction, keyword: str):
+    await interaction.response.defer()
+
+    if not interaction.guild:
+        await interaction.followup.send("このコマンドはサーバー内でのみ使用できます。", ephemeral=True)
+        return
+
+    guild_id_str = str(interaction.guild.id)
+    now_jst_cmd = datetime.now(timezone(timedelta(hours=9)))
+    current_date_str_cmd = now_jst_cmd.date().isoformat()
+
+    # /greeting remove と同じく、正規化した形（全角/半角・カタカナ/ひらがなの違いを無視）で登録済みのキーワードを探す
+    # （設定から削除されたキーワードも、記録が残っていれば表示できる）
+    normalized = normalize_greeting_text(keyword)
+    guild_keywords = list(greeting_settings.get(guild_id_str, {})) + list(greeting_history.get(guild_id_str, {}))
+    keyword = next((kw for kw in guild_keywords if normalize_greeting_text(kw) == normalized), keyword)
+
+    def get_member_display_name(user_id_str):
+        try:
+            member = interaction.guild.get_member(int(user_id_str))
+            return member.display_name if member else f"ID: {user_id_str}"
+        except (ValueError, TypeError):
+            return f"不明なID: {user_id_str}"
+
+    embed = discord.Embed(title=f"📜 今日の「{keyword}」ランキング", color=0xc0c0c0)
+    embed.set_footer(text=f"集計日時: {now_jst_cmd.strftime('%Y年%m月%d日 %H:%M:%S')}")
+
+    today_records = greeting_history.get(guild_id_str, {}).get(keyword, {}).get(current_date_str_cmd, {})
+    if not today_records:
+        embed.description = f"今日はまだ誰も「{keyword}」していません！"
+    else:
+        sorted_today = rank_entries(today_records)
+        lines = [f"{i+1}. {get_member_display_name(uid)} 🕒 {format_jst_time(ts)}" for i, (uid, ts) in enumerate(sorted_today[:10])]
+        embed.description = "\n".join(lines)
+
+    keyword_winners = greeting_winners.get(guild_id_str, {}).get(keyword, {})
+    if keyword_winners:
+        sorted_winners = count_winners(keyword_winners)
+        winner_lines = [f"{i+1}. {get_member_display_name(uid)} 🏆 {count} 回" for i, (uid, count) in enumerate(sorted_winners[:5])]
+        embed.add_field(name="🏅 一番乗り回数", value="\n".join(winner_lines), inline=False)
+
+    await interaction.followup.send(embed=embed)
+
+@greeting_top_command.autocomplete("keyword")
+async def greeting_top_keyword_autocomplete(interaction: discord.Interaction, current: str):
+    if not interaction.guild:
+        return []
+    guild_id_str = str(interaction.guild.id)
+    keywords = set(greeting_settings.get(guild_id_str, {})) | set(greeting_history.get(guild_id_str, {}))
+    normalized_current = normalize_greeting_text(current)
+    return [
+        app_commands.Choice(name=kw, value=kw)
+        for kw in sorted(keywords)
+        if normalized_current in normalize_greeting_text(kw)
+    ][:25]
+
+
 # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
 # ★ ここからが修正・追加されたコマンド
 # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
@@ -724,10 +1521,11 @@ async def akeome_top_command(interaction: discord.Interaction, another: app_comm
     poll="投票からスレッドを作成しますか？ (デフォルト: オフ)",
     media="画像や動画からスレッドを作成しますか？ (デフォルト: オフ)",
     file="ファイル添付からスレッドを作成しますか？ (デフォルト: オフ)",
-    link="リンクを含むメッセージからスレッドを作成しますか？ (デフォルト: オフ)"
+    link="リンクを含むメッセージからスレッドを作成しますか？ (デフォルト: オフ)",
+    backfill="このチャンネルの過去のメッセージにもスレッドを作成しますか？ (デフォルト: オフ)"
 )
 @app_commands.checks.has_permissions(manage_channels=True)
-async def threadline_command(interaction: discord.Interaction, message: bool=False, poll: bool=False, media: bool=False, file: bool=False, link: bool=False):
+async def threadline_command(interaction: discord.Interaction, message: bool=False, poll: bool=False, media: bool=False, file: bool=False, link: bool=False, backfill: bool=False):
     await interaction.response.defer(ephemeral=True)
 
     channel_id = str(interaction.channel_id)
@@ -739,18 +1537,245 @@ async def threadline_command(interaction: discord.Interaction, message: bool=Fal
     if file: enabled_types.append("file")
     if link: enabled_types.append("link")
 
+    # 保存するフィールド（設定が変わらなければ何も書き込まない）
+    updates = {}
     if enabled_types:
+        if threadline_settings.get(channel_id) != enabled_types:
+            updates[state_path("threadline_settings", channel_id)] = enabled_types
         threadline_settings[channel_id] = enabled_types
         enabled_text = ", ".join(f"`{t}`" for t in enabled_types)
         response_message = f"✅ このチャンネルの自動スレッド作成を有効にしました。\n対象: {enabled_text}"
     elif channel_id in threadline_settings:
         del threadline_settings[channel_id]
+        updates[state_path("threadline_settings", channel_id)] = google_firestore.DELETE_FIELD
         response_message = "❌ このチャンネルの自動スレッド作成をすべて無効にしました。"
     else:
         response_message = "ℹ️ このチャンネルの自動スレッド作成は、もとから無効です。"
 
-    await save_data_async()
-    await interaction.followup.send(response_message)
+    if not backfill or not enabled_types:
+        await save_data_async(updates)
+        await interaction.followup.send(response_message)
+        return
+
+    # --- バックフィル ---
+    channel = interaction.channel
+    if not isinstance(channel, discord.TextChannel):
+        await save_data_async(updates)
+        await interaction.followup.send(response_message + "\n⚠️ 過去のメッセージへのスレッド作成はテキストチャンネルでのみ使用できます。")
+        return
+    if channel_id in backfill_tasks or (channel_id in threadline_backfills and not backfill_claimable(threadline_backfills[channel_id])):
+        await save_data_async(updates)
+        await interaction.followup.send(response_message + "\nℹ️ 過去のメッセージへのスレッド作成は既に実行中です。")
+        return
+    if not await check_bot_permission(interaction.guild, channel, "create_public_threads") or not await check_bot_permission(interaction.guild, channel, "read_message_history"):
+        await save_data_async(updates)
+        await interaction.followup.send(response_message + "\n⚠️ 過去のメッセージへのスレッド作成には「公開スレッドの作成」と「メッセージ履歴を読む」権限が必要です。")
+        return
+
+    checkpoint = threadline_backfills.get(channel_id)
+    if checkpoint:
+        checkpoint["types"] = enabled_types
+        checkpoint["user_id"] = interaction.user.id
+        response_message += f"\n⏳ 前回の続きから過去のメッセージへのスレッド作成を再開します。(確認済み: {checkpoint['scanned']} 件)"
+    else:
+        checkpoint = threadline_backfills[channel_id] = {
+            "before": interaction.id,  # コマンド実行時点より前のメッセージが対象
+            "types": enabled_types,
+            "scanned": 0,
+            "created": 0,
+            "user_id": interaction.user.id,
+        }
+        response_message += "\n⏳ 過去のメッセージへのスレッド作成を開始します。"
+    checkpoint["owner"] = INSTANCE_ID
+    checkpoint["heartbeat"] = int(datetime.now(timezone.utc).timestamp())
+
+    updates[state_path("threadline_backfills", channel_id)] = dict(threadline_backfills[channel_id])
+    await save_data_async(updates)
+    progress_message = await interaction.followup.send(response_message, wait=True)
+    start_threadline_backfill(channel, progress_message)
+
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+# ★ 追加: バックフィル（過去のメッセージへのスレッド作成）
+# ★ channel.history() を新しい順に少しずつ読み込み、on_message と同じ判定で
+# ★ スレッドを作成します。進捗は一定件数ごとに保存し、再起動後も続きから再開します。
+# ★ 処理するインスタンスを進捗に記録し、複数のインスタンスが同じチャンネルを処理しないようにします。
+# ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
+def backfill_claimable(checkpoint: dict) -> bool:
+    """所有者がいない、自分が所有者、または所有者の進捗の保存が途絶えている場合に True を返します。"""
+    if checkpoint.get("owner") in (None, INSTANCE_ID):
+        return True
+    return datetime.now(timezone.utc).timestamp() - checkpoint.get("heartbeat", 0) > BACKFILL_OWNER_TIMEOUT
+
+async def claim_threadline_backfill(channel_id_str: str) -> bool:
+    """
+    バックフィルの所有者を自分にして保存し、引き受けられた場合は True を返します。
+    他のインスタンスが同時に引き受けた場合は後に保存したほうが残るため、リスナーで反映されるのを待ってから確認します。
+    """
+    checkpoint = threadline_backfills.get(channel_id_str)
+    if checkpoint is None or not backfill_claimable(checkpoint):
+        return False
+    checkpoint["owner"] = INSTANCE_ID
+    checkpoint["heartbeat"] = int(datetime.now(timezone.utc).timestamp())
+    await save_data_async({
+        state_path("threadline_backfills", channel_id_str, "owner"): checkpoint["owner"],
+        state_path("threadline_backfills", channel_id_str, "heartbeat"): checkpoint["heartbeat"],
+    })
+    await asyncio.sleep(BACKFILL_CLAIM_WAIT)
+    return threadline_backfills.get(channel_id_str) is checkpoint and checkpoint.get("owner") == INSTANCE_ID
+
+async def run_threadline_backfill(channel: discord.TextChannel, progress_message: discord.WebhookMessage = None):
+    channel_id_str = str(channel.id)
+    claimed = False
+    try:
+        claimed = await claim_threadline_backfill(channel_id_str)
+    except Exception as e:
+        print(f"[バックフィル] チャンネル '{channel.name}' の処理の引き受け中にエラー: {e}")
+    finally:
+        if not claimed:
+            backfill_tasks.pop(channel_id_str, None)
+    if not claimed:
+        print(f"[バックフィル] チャンネル '{channel.name}' は他のインスタンスが処理しているため、このインスタンスでは実行しません。")
+        if progress_message is not None:
+            try:
+                await progress_message.edit(content="ℹ️ 過去のメッセージへのスレッド作成は、別のインスタンスで実行中です。")
+            except Exception:
+                pass
+        return
+    checkpoint = threadline_backfills[channel_id_str]
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+    pending = set()
+    last_create_started = 0.0
+    scanned_since_checkpoint = 0
+    last_message_id = None
+
+    async def create_with_limit(message, message_type, thread_name, reaction_emoji):
+        try:
+            if await create_auto_thread(message, message_type, thread_name, reaction_emoji):
+                checkpoint["created"] += 1
+        finally:
+            semaphore.release()
+
+    async def report(text: str):
+        nonlocal progress_message
+        if progress_message is None:
+            return
+        try:
+            await progress_message.edit(content=text)
+        except Exception:
+            # インタラクションの有効期限（15分）が切れた場合など。以降は完了時のDMのみ
+            progress_message = None
+
+    def owns_checkpoint() -> bool:
+        # 他のインスタンスに引き継がれた、または削除された場合は False
+        return threadline_backfills.get(channel_id_str) is checkpoint and checkpoint.get("owner") == INSTANCE_ID
+
+    async def save_checkpoint(release: bool = False):
+        nonlocal scanned_since_checkpoint
+        await asyncio.gather(*pending)
+        if last_message_id is not None:
+            checkpoint["before"] = last_message_id
+        checkpoint["scanned"] += scanned_since_checkpoint
+        scanned_since_checkpoint = 0
+        if not owns_checkpoint():
+            return
+        checkpoint["heartbeat"] = int(datetime.now(timezone.utc).timestamp())
+        # 所有者は引き受けるときだけ書き込み、進捗の保存では他のインスタンスの引き受けを上書きしない
+        fields = ["before", "scanned", "created", "heartbeat"]
+        if release:
+            checkpoint["owner"] = None
+            fields.append("owner")
+        await save_data_async({state_path("threadline_backfills", channel_id_str, field): checkpoint[field] for field in fields})
+        await report(f"⏳ 過去のメッセージにスレッドを作成中です… (確認: {checkpoint['scanned']} 件 / 作成: {checkpoint['created']} 件)")
+
+    print(f"[バックフィル] チャンネル '{channel.name}' の処理を開始します。(基準ID: {checkpoint['before']})")
+    try:
+        # history() は非同期ジェネレーターとして少しずつ取得するため、履歴全体をメモリに載せない
+        async for message in channel.history(limit=None, before=discord.Object(id=checkpoint["before"])):
+            if not owns_checkpoint():
+                break
+            # on_message と同じ対象外条件
+            is_target = (
+                not message.author.bot
+                and message.type in (discord.MessageType.default, discord.MessageType.reply)
+                and not any(mode == MATCH_EXACT for _, mode in match_greetings(get_greeting_matcher(channel.guild.id), message.content))
+                and getattr(message, "thread", None) is None
+            )
+            if is_target:
+                message_event = normalize_message_event(message, checkpoint["types"])
+                message_type, thread_name, reaction_emoji = await run_task(classify_thread_message, message_event)
+                if message_type:
+                    await semaphore.acquire()
+                    wait_seconds = last_create_started + BACKFILL_CREATE_INTERVAL - client.loop.time()
+                    if wait_seconds > 0:
+                        await asyncio.sleep(wait_seconds)
+                    last_create_started = client.loop.time()
+                    task = client.loop.create_task(create_with_limit(message, message_type, thread_name, reaction_emoji))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+            # 処理し終えてから進める（途中でエラーになったメッセージは再開時にもう一度処理する）
+            scanned_since_checkpoint += 1
+            last_message_id = message.id
+            if scanned_since_checkpoint >= BACKFILL_CHECKPOINT_EVERY:
+                await save_checkpoint()
+
+        await asyncio.gather(*pending)
+        checkpoint["scanned"] += scanned_since_checkpoint
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[バックフィル] チャンネル '{channel.name}' の処理中にエラー: {e}")
+        # 中断したものは、どのインスタンスからでもすぐに再開できるよう所有者を外して保存する
+        await save_checkpoint(release=True)
+        await report(f"⚠️ 過去のメッセージへのスレッド作成を中断しました。もう一度実行すると続きから再開します。(エラー: {e})")
+        return
+    finally:
+        backfill_tasks.pop(channel_id_str, None)
+
+    if not owns_checkpoint():
+        print(f"[バックフィル] チャンネル '{channel.name}' の処理は他のインスタンスに引き継がれたか削除されたため、停止しました。")
+        return
+    threadline_backfills.pop(channel_id_str, None)
+    await save_data_async({state_path("threadline_backfills", channel_id_str): google_firestore.DELETE_FIELD})
+    summary = f"✅ 過去のメッセージへのスレッド作成が完了しました。(チャンネル: {channel.mention} / 確認: {checkpoint['scanned']} 件 / 作成: {checkpoint['created']} 件)"
+    print(f"[バックフィル] チャンネル '{channel.name}' の処理が完了しました。(確認: {checkpoint['scanned']} 件 / 作成: {checkpoint['created']} 件)")
+    if progress_message is not None:
+        await report(summary)
+    else:
+        user = client.get_user(checkpoint.get("user_id") or 0)
+        if user:
+            try:
+                await user.send(summary)
+            except discord.Forbidden:
+                pass
+
+def start_threadline_backfill(channel: discord.TextChannel, progress_message: discord.WebhookMessage = None) -> bool:
+    """バックフィルを開始します。既に実行中なら False を返します。"""
+    channel_id_str = str(channel.id)
+    if channel_id_str in backfill_tasks:
+        return False
+    backfill_tasks[channel_id_str] = client.loop.create_task(run_threadline_backfill(channel, progress_message))
+    return True
+
+def resume_threadline_backfills():
+    """
+    保存されている未完了のバックフィルを再開します。
+    他のインスタンスが処理中のものは、そのインスタンスが止まっていれば引き継げるよう、後でもう一度確認します。
+    """
+    global backfill_resume_handle
+    backfill_resume_handle = None
+    owned_elsewhere = False
+    for channel_id_str, checkpoint in list(threadline_backfills.items()):
+        if not backfill_claimable(checkpoint):
+            owned_elsewhere = True
+            continue
+        channel = client.get_channel(int(channel_id_str))
+        if not isinstance(channel, discord.TextChannel):
+            continue
+        if start_threadline_backfill(channel):
+            print(f"[バックフィル] チャンネル '{channel.name}' の未完了の処理を再開しました。")
+    if owned_elsewhere:
+        backfill_resume_handle = client.loop.call_later(BACKFILL_OWNER_TIMEOUT, resume_threadline_backfills)
 
 @threadline_command.error
 async def threadline_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
@@ -859,3 +1884,6 @@ if __name__ == "__main__":
             print("'MESSAGE CONTENT INTENT' と 'SERVER MEMBERS INTENT' を有効にしてください。")
         except Exception as e:
             print(f"Botの実行中に致命的なエラーが発生しました: {type(e).__name__} - {e}")
+        finally:
+            if state_listener is not None:
+                state_listener.unsubscribe()
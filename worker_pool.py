@@ -0,0 +1,168 @@
+# ---------- ワーカープロセス ----------
+# WORKER_PROCESSES を設定したときに使う、メッセージ判定専用の子プロセス群です。
+# 子プロセスはこのファイルを直接実行して起動するため、main.py（Discord/Firestoreの初期化）を読み込まず、
+# fork にも依存しません。親プロセスとは標準入出力のパイプでつながり、
+#   親 -> 子: [(要求ID, 処理名, 引数), ...]
+#   子 -> 親: [(要求ID, 成功したか, 結果またはエラー), ...]
+# を「長さ(4バイト) + pickle」の形式でやり取りします。
+# 同じイベントループの周回で届いた要求はワーカーごとにまとめて1回で送り、プロセス間通信の回数を減らします。
+import asyncio
+import os
+import pickle
+import struct
+import sys
+
+from feature_logic import classify_thread_message
+
+FRAME_HEADER = struct.Struct("<I")
+
+# ワーカーで実行できる処理（関数名 -> 関数）
+# ランキング集計は日時の受け渡しのほうが集計より重いため、同じプロセスで実行する（bench_workers.py を参照）
+TASKS = {func.__name__: func for func in (classify_thread_message,)}
+
+_workers = []
+_outbox = []
+_flush_scheduled = False
+_next_request_id = 0
+
+
+class WorkerUnavailable(Exception):
+    """ワーカープロセスが終了していて、結果を受け取れなかった場合に送出されます。"""
+
+
+def encode_frame(obj) -> bytes:
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+# ---------- 子プロセス側 ----------
+def worker_main():
+    """標準入力から要求のまとまりを読み、処理結果を標準出力に書き込みます。標準入力が閉じられたら終了します。"""
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    while True:
+        header = stdin.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        (length,) = FRAME_HEADER.unpack(header)
+        batch = pickle.loads(stdin.read(length))
+        results = []
+        for request_id, name, args in batch:
+            try:
+                results.append((request_id, True, TASKS[name](*args)))
+            except Exception as e:
+                results.append((request_id, False, f"{type(e).__name__}: {e}"))
+        stdout.write(encode_frame(results))
+        stdout.flush()
+
+
+# ---------- 親プロセス側 ----------
+async def start_workers(count: int) -> int:
+    """ワーカープロセスを count 個起動し、起動できた数を返します。"""
+    for _ in range(count - len(_workers)):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__),
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            )
+        except Exception as e:
+            print(f"[ワーカー] ワーカープロセスの起動中にエラー: {e}")
+            break
+        worker = {"process": process, "pending": {}}
+        worker["reader"] = asyncio.get_running_loop().create_task(_read_results(worker))
+        _workers.append(worker)
+    return len(_workers)
+
+
+async def _read_results(worker: dict):
+    """ワーカーからの結果を読み、対応する要求の Future に渡します。"""
+    stdout = worker["process"].stdout
+    try:
+        while True:
+            header = await stdout.readexactly(FRAME_HEADER.size)
+            (length,) = FRAME_HEADER.unpack(header)
+            results = pickle.loads(await stdout.readexactly(length))
+            for request_id, ok, value in results:
+                future = worker["pending"].pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(value))
+    except (asyncio.IncompleteReadError, ConnectionError, OSError, pickle.UnpicklingError):
+        pass
+    finally:
+        # 終了したワーカーには以降の要求を送らず、処理中だった要求は呼び出し元で実行し直してもらう
+        if worker in _workers:
+            _workers.remove(worker)
+            print(f"[ワーカー] ワーカープロセス (PID: {worker['process'].pid}) が終了しました。(残り: {len(_workers)} 個)")
+        for future in worker["pending"].values():
+            if not future.done():
+                future.set_exception(WorkerUnavailable())
+        worker["pending"].clear()
+
+
+def _flush_outbox():
+    """ためておいた要求を、処理中の要求が少ないワーカーから順に割り振ってまとめて送ります。"""
+    global _flush_scheduled
+    _flush_scheduled = False
+    requests = _outbox[:]
+    _outbox.clear()
+    batches = {}
+    for request_id, name, args, future in requests:
+        if not _workers:
+            future.set_exception(WorkerUnavailable())
+            continue
+        worker = min(_workers, key=lambda w: len(w["pending"]))
+        worker["pending"][request_id] = future
+        batches.setdefault(id(worker), (worker, []))[1].append((request_id, name, args))
+    for worker, batch in batches.values():
+        try:
+            worker["process"].stdin.write(encode_frame(batch))
+        except Exception:
+            # 書き込めなかった要求は、読み込み側の終了処理で WorkerUnavailable になる
+            worker["process"].kill()
+
+
+async def run_task(func, *args):
+    """
+    func(*args) をワーカープロセスで実行して結果を返します。
+    ワーカーを起動していない、またはワーカーが終了した場合は、このプロセスでそのまま実行します。
+    """
+    if not _workers or func.__name__ not in TASKS:
+        return func(*args)
+    global _flush_scheduled, _next_request_id
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _next_request_id += 1
+    _outbox.append((_next_request_id, func.__name__, args, future))
+    if not _flush_scheduled:
+        _flush_scheduled = True
+        loop.call_soon(_flush_outbox)
+    try:
+        return await future
+    except WorkerUnavailable:
+        return func(*args)
+
+
+async def stop_workers(timeout: float = 5.0):
+    """ワーカーの標準入力を閉じて終了を待ちます。時間内に終わらなければ強制終了します。"""
+    workers = _workers[:]
+    _workers.clear()
+    for worker in workers:
+        try:
+            worker["process"].stdin.close()
+        except Exception:
+            pass
+    for worker in workers:
+        try:
+            await asyncio.wait_for(worker["process"].wait(), timeout)
+        except asyncio.TimeoutError:
+            worker["process"].kill()
+            await worker["process"].wait()
+        worker["reader"].cancel()
+
+
+if __name__ == "__main__":
+    worker_main()